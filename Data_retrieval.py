@@ -1,44 +1,281 @@
 import os
 import json
 import re
-import requests
-import PyPDF2
-import pdfplumber
+import sys
+import tempfile
+import threading
+import weakref
 import pandas as pd
-import yfinance as yf
-import google.generativeai as genai
-from config import GEMINI_API_KEY  # Securely load API Key
+import llm_client
+import market_cache
+import pdf_cache
+import page_store
+import pdf_extract
+import section_index
+import statement_parser
+import tracing
+from pipeline import Pipeline
 
 
-genai.configure(api_key=GEMINI_API_KEY)  # Configure Gemini API
+### ---------------- PDF TEXT EXTRACTION ---------------- ###
+EXTRACTOR_VERSION = 1     # Bump when extraction output changes to invalidate cached documents
 
-model = genai.GenerativeModel('gemini-pro')
 
-### ---------------- PDF TEXT EXTRACTION ---------------- ###
-def extract_text_from_pdf(pdf_path):
-    """Extracts text from a given PDF file using pdfplumber."""
-    text = ""
+def _load_source(pdf_path):
+    """Returns (source to parse, content-addressed cache key) for a path or uploaded file."""
+    if isinstance(pdf_path, PdfDocument):
+        return pdf_path.path, pdf_path.key
+    if isinstance(pdf_path, (str, os.PathLike)):
+        # Workers re-open the file instead of receiving the bytes
+        return pdf_path, pdf_cache.file_key(pdf_path, EXTRACTOR_VERSION)
+    pdf_bytes = pdf_extract.read_pdf_bytes(pdf_path)
+    return pdf_bytes, pdf_cache.document_key(pdf_bytes, EXTRACTOR_VERSION)
+
+
+def _remove_file(path):
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                text += page.extract_text() + "\n"
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class PdfDocument:
+    """
+    A report read page by page instead of being passed around as one string.
+    Only the file path, content hash and page fingerprints are kept: iterating the document streams its page
+    texts from the page store (page_store) a few pages at a time or, on a miss, from pdfplumber shard by shard,
+    so stages that consume the pages as an iterator run in flat memory however long the report is, also when
+    several stages iterate it at once. Unlike a generator, a document can be iterated any number of times.
+    Uploaded files are spooled to a temporary file that is removed together with the document.
+    Because pages are stored by page fingerprint, a revised version of a filing only has its changed pages parsed.
+
+    Example:
+        document = PdfDocument(uploaded_file)
+        index, statement_pages = section_index.document_statements(document)
+        summary = summarize_text(document)
+    """
+
+    def __init__(self, pdf_path, workers=None, use_cache=True):
+        """
+        :param pdf_path: Path to the PDF, an uploaded file-like object, or the raw PDF bytes.
+        :param workers: Number of worker processes for extraction (None = one per CPU, 1 = serial).
+        :param use_cache: Read and write the on-disk PDF cache.
+        """
+        if isinstance(pdf_path, (str, os.PathLike)):
+            self.path = pdf_path
+        else:
+            pdf_bytes = pdf_path if isinstance(pdf_path, bytes) else pdf_extract.read_pdf_bytes(pdf_path)
+            with tempfile.NamedTemporaryFile(prefix="finsight-", suffix=".pdf", delete=False) as f:
+                f.write(pdf_bytes)
+            self.path = f.name
+            weakref.finalize(self, _remove_file, f.name)
+        self.key = pdf_cache.file_key(self.path, EXTRACTOR_VERSION)
+        self.workers = workers
+        self.use_cache = use_cache
+        self._fingerprints = None
+
+    def __iter__(self):
+        return self.pages()
+
+    def fingerprints(self):
+        """Content hash of every page (see pdf_extract.page_fingerprints)."""
+        if self._fingerprints is None:
+            self._fingerprints = page_store.document_fingerprints(self.key) or pdf_extract.page_fingerprints(self.path)
+        return self._fingerprints
+
+    def pages(self):
+        """Yields the text of every page in order. A full pass over an uncached document fills the cache."""
+        if self.use_cache:
+            fingerprints = self._fingerprints or page_store.document_fingerprints(self.key)
+            if fingerprints and all(fingerprints) and len(page_store.known(fingerprints)) == len(set(fingerprints)):
+                self._fingerprints = fingerprints
+                for i, text in enumerate(page_store.iter_texts(fingerprints)):
+                    # None if evicted in the meantime
+                    yield text if text is not None else pdf_extract.extract_pages(self.path, [i])[0]
+                return
+
+        # Page fingerprints not known yet: the whole page list of the PDF cache entry is loaded once and moved
+        # to the page store, so later passes stream it
+        entry = (pdf_cache.load(self.key) if self.use_cache else None) or {"pages": None, "tables": {}}
+        if entry["pages"] is not None:
+            fingerprints = self.fingerprints()
+            if len(fingerprints) == len(entry["pages"]):
+                page_store.put_many(dict(zip(fingerprints, entry["pages"])))
+            yield from entry["pages"]
+            return
+
+        started = tracing.start_span("pdf.extract_pages", cache_hit=False)
+        fingerprints, texts, new, parsed, parsed_count, error = [], [], {}, None, 0, None
+        try:
+            fingerprints = self.fingerprints()
+            stored = page_store.known(fingerprints) if self.use_cache else set()
+            # Pages seen in any earlier document (e.g. the previous version of this filing) are not parsed again,
+            # and repeated pages are parsed once
+            to_parse, seen = [], set(stored)
+            for i, fp in enumerate(fingerprints):
+                if fp is None or fp not in seen:
+                    to_parse.append(i)
+                    seen.add(fp)
+            parsed = pdf_extract.iter_pages(self.path, self.workers, to_parse)
+            to_parse = set(to_parse)
+
+            for i, fp in enumerate(fingerprints):
+                if i in to_parse:
+                    text = new[fp] = next(parsed)
+                    parsed_count += 1
+                else:
+                    text = new.get(fp)
+                    if text is None:
+                        text = page_store.get(fp)
+                    if text is None:  # Evicted in the meantime
+                        text = new[fp] = pdf_extract.extract_pages(self.path, [i])[0]
+                texts.append(text)  # Plain text is kept for the cache; pdfplumber's layout objects are not
+                yield text
+        except GeneratorExit:
+            raise  # The consumer stopped early (head(), select(), break): recorded as a partial pass below
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            if parsed is not None:
+                parsed.close()  # Stops the extraction workers of an unfinished pass
+            complete = error is None and len(texts) == len(fingerprints)
+            started.set(pages=len(texts), parsed=parsed_count, partial=not complete)
+            tracing.end_span(started, error=error)
+            if self.use_cache:
+                page_store.put_many(new)  # Pages parsed by a partial pass are not parsed again
+                if complete:
+                    entry["pages"] = texts
+                    pdf_cache.store(self.key, entry)
+
+    def select(self, indices):
+        """
+        Texts of the given pages as a dict of page index -> text. Reads them from the page store when the
+        page fingerprints are known, otherwise stops the pass over the pages after the last requested one.
+        """
+        wanted = set(indices)
+        if not wanted:
+            return {}
+        fingerprints = self._fingerprints or (page_store.document_fingerprints(self.key) if self.use_cache else None)
+        if fingerprints and max(wanted) < len(fingerprints):
+            texts = {i: page_store.get(fingerprints[i]) if fingerprints[i] else None for i in sorted(wanted)}
+            if all(text is not None for text in texts.values()):
+                return texts
+        texts = {}
+        for i, text in enumerate(self.pages()):
+            if i in wanted:
+                texts[i] = text
+                if len(texts) == len(wanted):
+                    break
+        return texts
+
+    def scan(self):
+        """Runs one pass over the pages, which fills the PDF cache for the stages after it. Returns the page count."""
+        return sum(1 for _ in self.pages())
+
+    def head(self, chars):
+        """The first `chars` characters of the document text, reading only as many pages as needed."""
+        parts, head = [], ""
+        for text in self.pages():
+            parts.append(text)
+            head = "\n".join(parts).strip()
+            if len(head) >= chars:
+                break
+        return head[:chars]
+
+    def text(self):
+        """The whole document text. Prefer iterating the pages for long documents."""
+        return "\n".join(self.pages()).strip()
+
+
+@tracing.traced("pdf.extract_pages")
+def extract_pages_from_pdf(pdf_path, workers=None, use_cache=True):
+    """
+    Extracts the text of every page of a PDF, in page order.
+    Large documents are split into shards of pdf_extract.PAGES_PER_SHARD pages that are parsed in a process pool.
+    Results are cached on disk by content hash, so re-opening the same report is close to free.
+    :param pdf_path: Path to the PDF or an uploaded file-like object.
+    :param workers: Number of worker processes (None = one per CPU, 1 = serial).
+    :param use_cache: Read and write the on-disk PDF cache.
+    :return: List with one text string per page
+    """
+    try:
+        source, key = _load_source(pdf_path)
+        entry = (pdf_cache.load(key) if use_cache else None) or {"pages": None, "tables": {}}
+        if entry["pages"] is not None:
+            tracing.annotate(pages=len(entry["pages"]), cache_hit=True)
+            return entry["pages"]
+
+        entry["pages"] = pdf_extract.parse_pages(source, workers)
+        tracing.annotate(pages=len(entry["pages"]), cache_hit=False)
+        if use_cache:
+            pdf_cache.store(key, entry)
+        return entry["pages"]
     except Exception as e:
         print(f"Error extracting text from PDF: {e}")
-    return text.strip()
+        return []
+
+
+@tracing.traced("pdf.extract_tables")
+def extract_tables_from_pdf(pdf_path, page_indices, use_cache=True):
+    """
+    Extracts tables from selected pages of a PDF with pdfplumber.
+    Tables are cached next to the page text, so each page is only parsed for tables once.
+    :param pdf_path: Path to the PDF or an uploaded file-like object.
+    :param page_indices: Zero-based indices of the pages to read tables from.
+    :return: Dict of page index -> list of tables (each a list of rows of cell strings)
+    """
+    try:
+        source, key = _load_source(pdf_path)
+        entry = (pdf_cache.load(key) if use_cache else None) or {"pages": None, "tables": {}}
+        missing = sorted({i for i in page_indices if str(i) not in entry["tables"]})
+        tracing.annotate(pages=len(page_indices), parsed=len(missing), cache_hit=not missing)
+        if missing:
+            # Only the requested pages are loaded, not the layout of the whole document
+            with pdf_extract.open_pdf(source, pages=[i + 1 for i in missing]) as pdf:
+                for i, page in zip(missing, pdf.pages):
+                    try:
+                        entry["tables"][str(i)] = page.extract_tables()
+                    except Exception as e:
+                        print(f"Error extracting tables from page {i + 1}: {e}")
+                        entry["tables"][str(i)] = []
+                    finally:
+                        page.close()
+            if use_cache:
+                pdf_cache.store(key, entry)
+        return {i: entry["tables"][str(i)] for i in page_indices}
+    except Exception as e:
+        print(f"Error extracting tables from PDF: {e}")
+        return {}
+
+
+def extract_text_from_pdf(pdf_path, workers=None, use_cache=True):
+    """Extracts text from a given PDF file using pdfplumber."""
+    return "\n".join(extract_pages_from_pdf(pdf_path, workers=workers, use_cache=use_cache)).strip()
 
 ### ---------------- COMPANY NAME EXTRACTION ---------------- ###
-def extract_company_name_llm(text,api_key=GEMINI_API_KEY):
-    """Extracts the company name from a financial report using Gemini API."""
+def extract_company_name_llm(text,api_key=None):
+    """Extracts the company name from a financial report using Gemini API.
+    api_key is unused and kept for compatibility; the backend reads GEMINI_API_KEY from config."""
     prompt = f"Extract the company name from the following financial report:\n{text[:2000]}"  
-    response = model.generate_content(prompt)
-    return response.text.strip()
+    return llm_client.generate_text(prompt).strip()
 
 ### ---------------- KEY METRICS EXTRACTION ---------------- ###
 
-def extract_key_metrics_llm(text):
-    """Use Gemini API to extract financial metrics for all years from the report."""
+@tracing.traced("llm.extract_key_metrics")
+def extract_key_metrics_llm(text, pages=None):
+    """
+    Use Gemini API to extract financial metrics for all years from the report.
+    :param text: Full report text.
+    :param pages: Optional list of page texts. When given, only the income statement, balance sheet and
+                  cash flow statement pages located by section_index are sent to Gemini.
+    :return: Long-format DataFrame (Year | Metric | Value), or None on failure
+    """
+    if pages:
+        text = section_index.statement_text(pages) or text
     prompt = f"""
     Extract financial data from this report text and return only JSON.
+    Report every value in full currency units (e.g. 574785000000, not 574,785 in millions).
     
     {text}
     
@@ -86,15 +323,11 @@ def extract_key_metrics_llm(text):
     """
 
     try:
-        # Call Gemini API
-        model = genai.GenerativeModel("gemini-pro")
-        response = model.generate_content(prompt)
+        # Call Gemini API (identical prompts are served from the response cache, and the reply is kept
+        # with the statement pages it was read from)
+        response_text = llm_client.generate_text(prompt, keep=True).strip()
 
-        # Debugging: Print full response
-        print("Gemini API Raw Response:", response)
-
-        # Extract the JSON content from the response
-        response_text = response.text.strip()
+        tracing.annotate(response_chars=len(response_text))
 
         # Clean response to extract only JSON part
         json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
@@ -125,6 +358,42 @@ def extract_key_metrics_llm(text):
         print("Unexpected Error:", e)
         return None
 
+def extract_key_metrics(pdf_path, pages=None, text=None):
+    """
+    Extracts the key financial metrics from a report, reading the statement tables locally and
+    calling Gemini only for the metrics that could not be found there.
+    :param pdf_path: Path to the PDF, an uploaded file-like object, or a PdfDocument. A PdfDocument is scanned
+                     as a stream and only its statement pages are kept in memory.
+    :param pages: Page texts of the PDF, if already extracted.
+    :param text: Full report text for the Gemini fallback, if already available.
+    :return: Long-format DataFrame (Year | Metric | Value), or None if nothing could be extracted
+    """
+    if isinstance(pdf_path, PdfDocument) and pages is None:
+        index, pages = section_index.document_statements(pdf_path)
+    else:
+        pages = pages if pages is not None else extract_pages_from_pdf(pdf_path)
+        index = section_index.get_section_index(pages)
+    selected = sorted({i for page_indices in index.values() for i in page_indices})
+    tables = extract_tables_from_pdf(pdf_path, selected)
+    with tracing.span("transform.statement_parse", pages=len(pages)):
+        df = statement_parser.extract_metrics(pages, index, tables)
+
+    found = set(df.loc[df["Value"].notna(), "Metric"])
+    missing = [metric for metric in statement_parser.KEY_METRICS if metric not in found]
+    if missing:
+        print(f"Metrics not found in statement tables, asking Gemini: {', '.join(missing)}")
+        if isinstance(pages, dict):
+            statements = "\n".join(pages[i] for i in selected).strip()
+            llm_df = extract_key_metrics_llm(statements or text or pdf_path.text())
+        else:
+            llm_df = extract_key_metrics_llm(text or "\n".join(pages).strip(), pages=pages)
+        if llm_df is not None:
+            df = pd.concat([df, llm_df[llm_df["Metric"].isin(missing)]], ignore_index=True)
+            df = df.sort_values("Metric", key=lambda m: m.map(statement_parser.KEY_METRICS.index), kind="stable")
+            df = df.reset_index(drop=True)
+
+    return df if not df.empty else None
+
 # ### ---------------- JSON TO DATAFRAME CONVERSION ---------------- ###
 # def json_to_dataframe(key_metrics):
 #     """Converts extracted financial metrics JSON into a structured Pandas DataFrame."""
@@ -147,81 +416,220 @@ def extract_key_metrics_llm(text):
 #     return df
 
 ### ---------------- YAHOO FINANCE TICKER FETCHING ---------------- ###
+YAHOO_SEARCH_URL = "https://query2.finance.yahoo.com/v1/finance/search"
+HTTP_TIMEOUT = 10      # Seconds per request (connect and read)
+HTTP_RETRIES = 3       # Attempts for transient failures, with exponential backoff
+HTTP_BACKOFF = 0.5     # Backoff base in seconds: 0.5, 1, 2, ...
+FETCH_WORKERS = 8      # Companies fetched concurrently
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """
+    Returns the shared keep-alive HTTP session (connection pooling, timeouts, retries with backoff).
+    It is the only retry layer for Yahoo requests, including the ones yfinance sends.
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            # Imported on first use: requests / urllib3 are not needed for PDF-only work
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            class _TimeoutAdapter(HTTPAdapter):
+                # Caps every request at HTTP_TIMEOUT, including those yfinance sends with its own, longer default
+                def send(self, request, timeout=None, **kwargs):
+                    if timeout is None or isinstance(timeout, (int, float)):
+                        timeout = min(timeout or HTTP_TIMEOUT, HTTP_TIMEOUT)
+                    return super().send(request, timeout=timeout, **kwargs)
+
+            retry = Retry(total=HTTP_RETRIES, backoff_factor=HTTP_BACKOFF,
+                          status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",))
+            adapter = _TimeoutAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["User-Agent"] = "Mozilla/5.0"
+            _http_session = session
+    return _http_session
+
+
+@tracing.traced("yahoo.search")
 def get_ticker_from_search(company_name):
-    """Fetches the stock ticker symbol for a company using Yahoo Finance."""
-    url = "https://query2.finance.yahoo.com/v1/finance/search"
+    """Fetches the stock ticker symbol for a company using Yahoo Finance (cached in market_cache)."""
+    cached = market_cache.lookup_ticker(company_name)
+    tracing.annotate(company=company_name, cache_hit=cached is not None)
+    if cached is not None:
+        return cached or None
+
     params = {"q": company_name, "quotes_count": 1, "country": "United States"}
-    headers = {'User-Agent': 'Mozilla/5.0'}
 
     try:
-        res = requests.get(url, params=params, headers=headers)
+        res = get_http_session().get(YAHOO_SEARCH_URL, params=params, timeout=HTTP_TIMEOUT)
         data = res.json()
-        if data['quotes']:
-            return data['quotes'][0]['symbol']
+        ticker = data['quotes'][0]['symbol'] if data['quotes'] else None
+        market_cache.store_ticker(company_name, ticker)
+        return ticker
     except Exception as e:
         print(f"Error fetching ticker for {company_name}: {e}")
     return None
 
 ### ---------------- FINANCIAL METRICS FETCHING FROM YAHOO FINANCE ---------------- ###
-def fetch_financial_metrics(ticker_symbol, years=3):
-    stock = yf.Ticker(ticker_symbol)
+@tracing.traced("yahoo.fundamentals")
+def fetch_financial_metrics(ticker_symbol, years=3, max_age=market_cache.FUNDAMENTALS_MAX_AGE):
+    """
+    Returns the latest `years` years of fundamentals for a ticker as a long-format DataFrame
+    (None if Yahoo Finance has no statements for it).
+    Served from market_cache while the cached data is younger than max_age seconds.
+    """
+    df = market_cache.load_fundamentals(ticker_symbol, years, max_age=max_age)
+    tracing.annotate(ticker=ticker_symbol, cache_hit=df is not None)
+    if df is None:
+        df = _fetch_financial_metrics_yahoo(ticker_symbol, years)
+        if df is not None:
+            market_cache.store_fundamentals(ticker_symbol, df)
+    return df
+
+
+# Metric -> (statement, Yahoo Finance line item). Margins is derived from EBITDA / Revenue.
+YAHOO_METRIC_MAP = {
+    "Revenue": ("income", "Total Revenue"),
+    "EBITDA": ("income", "EBITDA"),
+    "Net Profit": ("income", "Net Income"),
+    "Total Assets": ("balance", "Total Assets"),
+    "Total Liabilities": ("balance", "Total Liabilities Net Minority Interest"),
+    "Equity": ("balance", "Stockholders Equity"),
+    "Operating Cash Flow": ("cashflow", "Operating Cash Flow"),
+    "Investing Cash Flow": ("cashflow", "Investing Cash Flow"),
+    "Financing Cash Flow": ("cashflow", "Financing Cash Flow"),
+}
+YAHOO_METRIC_ORDER = ["Revenue", "EBITDA", "Net Profit", "Margins", "Total Assets", "Total Liabilities",
+                      "Equity", "Operating Cash Flow", "Investing Cash Flow", "Financing Cash Flow"]
+
+
+def _select_statement_rows(statement, metrics, years):
+    """
+    Selects the line items for `metrics` and the fiscal `years` from one statement in a single reindex.
+    When a year has several columns the first (latest) one is used; missing cells become NaN.
+    """
+    line_items = [YAHOO_METRIC_MAP[metric][1] for metric in metrics]
+    if statement.empty:
+        return pd.DataFrame(index=metrics, columns=years, dtype=float)
+    statement_years = pd.DatetimeIndex(statement.columns).year
+    by_year = statement.loc[:, ~statement_years.duplicated()]
+    by_year.columns = statement_years[~statement_years.duplicated()]
+    return by_year.reindex(index=line_items, columns=years).set_axis(metrics, axis=0)
 
-    # Get available data periods
-    income_stmt = stock.financials
-    balance_sheet = stock.balance_sheet
-    cash_flow = stock.cashflow
 
-    # Extract the latest available years
-    available_years = sorted(list(income_stmt.columns.year), reverse=True)
+def _fetch_financial_metrics_yahoo(ticker_symbol, years=3):
+    """Downloads fundamentals for a ticker from Yahoo Finance."""
+    import yfinance as yf  # Slow to import, and only needed on a fundamentals cache miss
+
+    stock = yf.Ticker(ticker_symbol, session=get_http_session())
+
+    # Get available data periods
+    statements = {"income": stock.financials, "balance": stock.balance_sheet, "cashflow": stock.cashflow}
 
     # Get only the past 'years' financial data
-    selected_years = available_years[:years]
+    selected_years = sorted(set(pd.DatetimeIndex(statements["income"].columns).year), reverse=True)[:years]
+    if not selected_years:
+        return None  # Unknown ticker or no statements published
 
-    financial_data = []
+    # One Metric x Year frame for all statements
+    with tracing.span("transform.yahoo_statements", ticker=ticker_symbol):
+        return _statements_to_long(statements, selected_years)
 
-    for year in selected_years:
-        try:
-            year_data = {
-                "Year": year,
-                "Revenue": income_stmt.loc["Total Revenue", str(year)].iloc[0] if "Total Revenue" in income_stmt.index else None,
-                "EBITDA": income_stmt.loc["EBITDA", str(year)].iloc[0] if "EBITDA" in income_stmt.index else None,
-                "Net Profit": income_stmt.loc["Net Income", str(year)].iloc[0] if "Net Income" in income_stmt.index else None,
-                "Margins": (income_stmt.loc["EBITDA", str(year)].iloc[0] / income_stmt.loc["Total Revenue", str(year)].iloc[0])
-                           if "EBITDA" in income_stmt.index and "Total Revenue" in income_stmt.index else None,
-                "Total Assets": balance_sheet.loc["Total Assets", str(year)].iloc[0] if "Total Assets" in balance_sheet.index else None,
-                "Total Liabilities": balance_sheet.loc["Total Liabilities Net Minority Interest", str(year)].iloc[0]
-                                     if "Total Liabilities Net Minority Interest" in balance_sheet.index else None,
-                "Equity": balance_sheet.loc["Stockholders Equity", str(year)].iloc[0] if "Stockholders Equity" in balance_sheet.index else None,
-                "Operating Cash Flow": cash_flow.loc["Operating Cash Flow", str(year)].iloc[0] if "Operating Cash Flow" in cash_flow.index else None,
-                "Investing Cash Flow": cash_flow.loc["Investing Cash Flow", str(year)].iloc[0] if "Investing Cash Flow" in cash_flow.index else None,
-                "Financing Cash Flow": cash_flow.loc["Financing Cash Flow", str(year)].iloc[0] if "Financing Cash Flow" in cash_flow.index else None,
-            }
-            financial_data.append(year_data)
-        except KeyError:
-            continue  # Skip if any key is missing
-
-    # Convert to DataFrame
-    df = pd.DataFrame(financial_data)
+
+def _statements_to_long(statements, selected_years):
+    """Reshapes the three Yahoo statements into a long-format Year | Metric | Value frame."""
+    wide = pd.concat([
+        _select_statement_rows(statement, [m for m, (name, _) in YAHOO_METRIC_MAP.items() if name == key], selected_years)
+        for key, statement in statements.items()
+    ]).astype(float)
+    wide.loc["Margins"] = wide.loc["EBITDA"] / wide.loc["Revenue"]
+    wide = wide.reindex(YAHOO_METRIC_ORDER)
 
     # Convert to long-format table (Year | Metric | Value)
-    df_melted = df.melt(id_vars=["Year"], var_name="Metric", value_name="Value")
+    df_melted = wide.T.rename_axis("Year").reset_index().melt(id_vars=["Year"], var_name="Metric", value_name="Value")
 
     return df_melted
 
+### ---------------- PEER GROUP FETCHING ---------------- ###
+def _fetch_company_metrics(company_name):
+    """Resolves one company's ticker and fetches its financials, tagged with the company name."""
+    ticker = get_ticker_from_search(company_name)
+    if not ticker:
+        print(f"Warning: Could not find ticker for {company_name}.")
+        return None
+
+    try:
+        data = fetch_financial_metrics(ticker)
+    except Exception as e:
+        print(f"Error fetching financial metrics for {company_name} ({ticker}): {e}")
+        data = None
+    if data is None:
+        print(f"Warning: No financial data found for {company_name}.")
+        return None
+
+    data["Company"] = company_name  # Add company name for identification
+    store_metrics(data, company_name, "yahoo")
+    return data
+
+
+def store_metrics(df, company_name, source):
+    """Saves metrics to the columnar metrics store; a failed write never fails the analysis."""
+    import metrics_store  # pyarrow is only loaded once something is stored
+
+    try:
+        metrics_store.upsert(df, company_name, source=source)
+    except Exception as e:
+        print(f"Warning: Could not save metrics for {company_name} to the metrics store: {e}")
+
+
+def fetch_peer_metrics(company_names, max_workers=FETCH_WORKERS):
+    """
+    Fetches financial metrics for a group of companies concurrently.
+    :param company_names: Company names to look up.
+    :param max_workers: Maximum number of companies fetched at the same time.
+    :return: List of long-format DataFrames (or None where fetching failed), in the order of company_names
+    """
+    if not company_names:
+        return []
+    with tracing.ThreadPoolExecutor(max_workers=min(max_workers, len(company_names))) as pool:
+        return list(pool.map(_fetch_company_metrics, company_names))
+
+
+def prefetch_peer_group(company_names, max_workers=FETCH_WORKERS):
+    """
+    Warms the ticker index and fundamentals cache for a whole peer group in one go,
+    so later comparisons are served without network calls.
+    :return: Names of the companies that could not be fetched
+    """
+    results = fetch_peer_metrics(company_names, max_workers=max_workers)
+    return [name for name, data in zip(company_names, results) if data is None]
+
 
 def main():
     # Step 1: Ask for financial report PDF path
     pdf_path = input("Enter the path to the financial report PDF: ")
 
     # Step 2: Extract text from the PDF
-    text = extract_text_from_pdf(pdf_path)
+    pages = extract_pages_from_pdf(pdf_path)
+    text = "\n".join(pages).strip()
 
-    # Step 3: Extract company name from the report
-    company_name = extract_company_name_llm(text, api_key=GEMINI_API_KEY)
+    # Step 3 & 4: Extract company name and key metrics from the report (concurrently)
+    pipeline = Pipeline()
+    pipeline.add("company_name", extract_company_name_llm, text)
+    pipeline.add("metrics", extract_key_metrics, pdf_path, pages=pages, text=text)
+    results = pipeline.run()
+
+    company_name = results["company_name"]
     print("\nExtracted Company Name:", company_name)
 
-    # Step 4: Extract key metrics from the financial report
-    df_metrics = extract_key_metrics_llm(text)
+    df_metrics = results["metrics"]
     if df_metrics is None:
         print("Error extracting key financial metrics from the report.")
         return
@@ -230,21 +638,10 @@ def main():
 
      # Step 5: Ask user for competitor names
     competitors = input("\nEnter competitor company names (comma-separated): ").split(",")
-    competitors = [comp.strip() for comp in competitors]  # Clean up spaces
-
-    # Step 6: Get tickers for each competitor
-    competitor_data = []
-    for competitor in competitors:
-        ticker = get_ticker_from_search(competitor)
-        if ticker:
-            data = fetch_financial_metrics(ticker)
-            if data is not None:
-                data["Company"] = competitor  # Add company name for identification
-                competitor_data.append(data)
-            else:
-                print(f"Warning: No financial data found for {competitor}.")
-        else:
-            print(f"Warning: Could not find ticker for {competitor}.")
+    competitors = [comp.strip() for comp in competitors if comp.strip()]  # Clean up spaces
+
+    # Step 6: Get tickers and financials for all competitors concurrently
+    competitor_data = [data for data in fetch_peer_metrics(competitors) if data is not None]
 
     # Step 7: Combine competitor data
     if competitor_data:
@@ -261,5 +658,11 @@ def main():
         print("\nExtracted Earnings Call Transcript (First 500 characters):\n", transcript_text[:500])
 
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 2 and sys.argv[1] == "--prefetch":
+        # Usage: python Data_retrieval.py --prefetch "Amazon, Walmart, Target"
+        peers = [name.strip() for name in " ".join(sys.argv[2:]).split(",") if name.strip()]
+        failed = prefetch_peer_group(peers)
+        print(f"Cached {len(peers) - len(failed)} of {len(peers)} companies.")
+    else:
+        main()
 
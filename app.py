@@ -1,19 +1,39 @@
 import streamlit as st
+import hashlib
+import os
+import time
 import pandas as pd
 import plotly.express as px
-import plotly.graph_objects as go
-from io import BytesIO
-from fpdf import FPDF
 from sentiment_analyzer import ensemble_sentiment_analysis
-from summarizer import summarize_text, summarize_financial_metrics, summarize_comparison, compare_metrics
-from Data_retrieval import extract_text_from_pdf, extract_company_name_llm, extract_key_metrics_llm, get_ticker_from_search, fetch_financial_metrics
+from sentiment_engine import analyze_sentiment, aggregate_sentiment
+from summarizer import condense_text, summarize_text_stream, summarize_financial_metrics_stream, summarize_comparison_stream, compare_metrics
+from Data_retrieval import PdfDocument, store_metrics, extract_company_name_llm, extract_key_metrics
+from pipeline import Pipeline
+from background import JobManager
+import ratios
+import revisions
+import search_index
+import tracing
 
 # Set Page Configuration
 st.set_page_config(page_title="Financial Insights Dashboard", layout="wide")
 
+# Optional Prometheus-style endpoint with span timings
+if os.environ.get("FINSIGHT_METRICS_PORT"):
+    tracing.start_metrics_server(int(os.environ["FINSIGHT_METRICS_PORT"]))
+
+# One job pool per server process, shared by all sessions; finished jobs are reused by key
+@st.cache_resource
+def get_job_manager():
+    return JobManager()
+
+def file_digest(uploaded_file):
+    return hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+
 # Sidebar Navigation
 st.sidebar.header("📊 FinSight AI")
-page = st.sidebar.radio("Navigation", ["Upload Financial Report", "Competitor Comparison", "Sentiment Analysis"])
+page = st.sidebar.radio("Navigation", ["Upload Financial Report", "Competitor Comparison", "Sentiment Analysis",
+                                       "Search"])
 
 # Function to create summary cards
 def summary_card(title, value, color):
@@ -26,72 +46,197 @@ def summary_card(title, value, color):
         """, unsafe_allow_html=True
     )
 
+# Function to show where the time of one analysis run went
+def timing_panel(spans):
+    with st.expander("⏱️ Timing Breakdown"):
+        timings = tracing.breakdown(spans)
+        if timings.empty:
+            st.write("No timings recorded.")
+            return
+        st.write(timings)
+        fig = px.bar(timings, x="Total s", y="Span", color="Category", orientation="h")
+        st.plotly_chart(fig, use_container_width=True)
+
+# Function to show what a re-upload of a revised document had to recompute
+def revision_note(revision):
+    if revision["previous"] is not None:
+        st.caption(f"🔁 Matched an earlier upload: {len(revision['changed_pages'])} of {revision['pages']} "
+                   f"pages changed, {len(revision['stale'])} of {revision['artifacts']} artifacts recomputed.")
+
+# Function to show a background job's progress; returns its result once finished.
+# A failed job stays failed (and is not re-run on every rerun) until the user retries it.
+def job_result(job):
+    if not job.done:
+        @st.fragment(run_every=1.0)
+        def progress():
+            if job.done:
+                st.rerun()  # Render the finished results on the full page
+            st.progress(job.progress, text=job.message)
+        progress()
+        return None
+    if job.error is not None:
+        st.error(f"Analysis failed: {job.error}")
+        if st.button("Retry", key=f"retry-{job.key}"):
+            get_job_manager().discard(job.key)
+            st.rerun()
+        return None
+    return job.result()
+
+# Background jobs (they run outside the Streamlit script, so they must not call st.*).
+# Summaries are streamed on the page instead; the jobs run the map-reduce part of long-document summaries
+# ahead of time (condense_text), so the streamed summary only waits for the final response.
+# Reports are kept as PdfDocuments, which stream their pages from the PDF cache, rather than as one string
+# held by every memoized job. Every analysed document is added to the search index.
+def analyze_report(job, pdf_bytes, file_name=None):
+    with tracing.capture() as spans:
+        job.report(0.05, "Extracting text")
+        document = PdfDocument(pdf_bytes)
+        document.scan()
+        revision = revisions.plan_revision(document, kinds=("summary", "metrics"))
+        job.report(0.2, f"{len(revision['stale'])} of {revision['artifacts']} artifacts to compute")
+
+        # Independent stages run concurrently
+        pipeline = Pipeline()
+        pipeline.add("company_name", extract_company_name_llm, document.head(2000))
+        pipeline.add("key_metrics", extract_key_metrics, document)
+        pipeline.add("summary_parts", condense_text, document, "financial report")
+        results = pipeline.run(on_stage_done=lambda name, done, total: job.report(
+            0.2 + 0.8 * done / total, f"Finished {name.replace('_', ' ')} ({done}/{total})"))
+
+    if results["key_metrics"] is not None:
+        store_metrics(results["key_metrics"], results["company_name"], "report")
+    search_index.index_analysis(document, "report", name=file_name, company=results["company_name"],
+                                metrics=results["key_metrics"])
+    return dict(results, document=document, revision=revision, spans=spans)
+
+def analyze_competitors(job, company_name, competitors):
+    with tracing.capture() as spans:
+        job.report(0.1, "Fetching financials")
+        df_comparison = compare_metrics(company_name, list(competitors))
+        peer_ratios = ranks = None
+        if df_comparison is not None and not df_comparison.empty:
+            job.report(0.8, "Computing peer ratios")
+            peer_ratios, ranks = ratios.peer_group_ratios(df_comparison)
+    return {"comparison": df_comparison, "ratios": peer_ratios, "ranks": ranks, "spans": spans}
+
+def analyze_transcript(job, pdf_bytes, file_name=None):
+    with tracing.capture() as spans:
+        job.report(0.05, "Extracting text")
+        document = PdfDocument(pdf_bytes)
+        document.scan()
+        revision = revisions.plan_revision(document, kinds=("summary", "sentiment"))
+        job.report(0.3, "Analyzing sentiment")
+        sentiment_result = ensemble_sentiment_analysis(document)
+        by_speaker = aggregate_sentiment(analyze_sentiment(document), by="speaker")
+        job.report(0.7, "Preparing summary")
+        condense_text(document, "earnings call transcript")
+    search_index.index_analysis(document, "transcript", name=file_name)
+    return {"document": document, "sentiment": sentiment_result, "by_speaker": by_speaker, "revision": revision,
+            "spans": spans}
+
 if page == "Upload Financial Report":
     st.title("📊 FinSight AI")
     st.subheader("📂 Upload Financial Report PDF")
     uploaded_file = st.file_uploader("Upload a financial report PDF", type=["pdf"])
     
     if uploaded_file:
-        report_text = extract_text_from_pdf(uploaded_file)
-        company_name = extract_company_name_llm(report_text)
-        key_metrics_df = extract_key_metrics_llm(report_text)
-        summary_text = summarize_text(report_text, "financial report")
-        metrics_summary = summarize_financial_metrics(key_metrics_df)
-        
-        st.header(f"Company: {company_name}")
-        
-        # Display Summary Cards
-        col1, col2 = st.columns(2)
-        col1.markdown("### 📄 Report Summary")
-        col1.write(summary_text)
-        col2.markdown("### 📊 Key Metrics Summary")
-        col2.write(metrics_summary)
-        
-        # Display Year-wise Key Metrics
-        if not key_metrics_df.empty:
-            st.markdown("### 📈 Year-over-Year Financial Metrics")
-            st.write(key_metrics_df)
-            fig = px.line(key_metrics_df, x="Year", y="Value", color="Metric", markers=True)
-            st.plotly_chart(fig, use_container_width=True)
+        job = get_job_manager().submit(("report", file_digest(uploaded_file)), analyze_report,
+                                       uploaded_file.getvalue(), uploaded_file.name)
+        results = job_result(job)
+
+        if results is not None:
+            company_name = results["company_name"]
+            key_metrics_df = results["key_metrics"]
+
+            # Shared with the other pages
+            st.session_state["company_name"] = company_name
+            st.session_state["key_metrics"] = key_metrics_df
+            
+            st.header(f"Company: {company_name}")
+            revision_note(results["revision"])
+            
+            # Display Year-wise Key Metrics
+            if key_metrics_df is not None and not key_metrics_df.empty:
+                st.markdown("### 📈 Year-over-Year Financial Metrics")
+                st.write(key_metrics_df)
+                fig = px.line(key_metrics_df, x="Year", y="Value", color="Metric", markers=True)
+                st.plotly_chart(fig, use_container_width=True)
+
+            # Display Summary Cards (streamed as they are written; cached once complete)
+            col1, col2 = st.columns(2)
+            with tracing.capture() as stream_spans:
+                col2.markdown("### 📊 Key Metrics Summary")
+                col2.write_stream(summarize_financial_metrics_stream(key_metrics_df))
+                col1.markdown("### 📄 Report Summary")
+                col1.write_stream(summarize_text_stream(results["document"], "financial report"))
+
+            timing_panel(results["spans"] + stream_spans)
     
 
 elif page == "Competitor Comparison":
     st.title("🏆 Competitor Benchmarking")
-    if 'company_name' not in locals():
-        company_name = st.text_input("Enter Company Name (or upload a report in previous tab)", "")
+    company_name = st.text_input("Enter Company Name (or upload a report in previous tab)",
+                                 st.session_state.get("company_name", ""))
     competitors = st.text_area("Enter Competitor Names (comma-separated)").split(",")
+    competitors = tuple(competitor.strip() for competitor in competitors if competitor.strip())
     
-    if st.button("Compare"):
-        if company_name and competitors:
-            df_comparison = compare_metrics(company_name, competitors)
-            main_company_data = df_comparison[df_comparison["Company"] == company_name]
-            competitor_data = df_comparison[df_comparison["Company"] != company_name]
+    if st.button("Compare") and company_name and competitors:
+        st.session_state["comparison_key"] = ("comparison", company_name, competitors)
+
+    comparison_key = st.session_state.get("comparison_key")
+    if comparison_key:
+        _, company_name, competitors = comparison_key
+        job = get_job_manager().submit(comparison_key, analyze_competitors, company_name, competitors)
+        results = job_result(job)
+
+        if results is not None and (results["comparison"] is None or results["comparison"].empty):
+            st.error(f"Could not fetch financial metrics for {company_name}.")
+        elif results is not None:
+            df_comparison = results["comparison"]
 
             # Display Comparison Table
             st.markdown("### 📊 Financial key metrics Comparison")
             st.write(df_comparison)
           
-            st.markdown("### 📋 Competitive Summary")
-            st.write(summarize_comparison(main_company_data, competitor_data))
-        
-            
             # Plot Bar Chart
             fig = px.bar(df_comparison, x="Company", y="Value", color="Metric", barmode="group")
             st.plotly_chart(fig, use_container_width=True)
 
+            # Precomputed ratios and where the company ranks in its peer group (100 = strongest)
+            if results["ratios"] is not None and not results["ratios"].empty:
+                st.markdown("### 📐 Peer Group Ratios (latest fiscal year)")
+                st.write(ratios.latest_ratios(results["ratios"]))
+                if company_name in results["ranks"].index:
+                    st.markdown(f"#### 🏅 {company_name} Percentile Rank in Peer Group")
+                    st.bar_chart(results["ranks"].loc[company_name].dropna())
+
+            st.markdown("### 📋 Competitive Summary")
+            main_company_data = df_comparison[df_comparison["Company"] == company_name]
+            competitor_data = df_comparison[df_comparison["Company"] != company_name]
+            with tracing.capture() as stream_spans:
+                st.write_stream(summarize_comparison_stream(main_company_data, competitor_data,
+                                                            results["ratios"], results["ranks"]))
+
+            timing_panel(results["spans"] + stream_spans)
+
 elif page == "Sentiment Analysis":
     st.title("🔍 Earnings Call Sentiment Analysis")
     transcript_file = st.file_uploader("Upload Earnings Call Transcript PDF (Optional)", type=["pdf"])
     
+    results = None
     if transcript_file:
-        transcript_text = extract_text_from_pdf(transcript_file)
-        transcript_summary = summarize_text(transcript_text, "earnings call transcript")
-        
+        job = get_job_manager().submit(("transcript", file_digest(transcript_file)), analyze_transcript,
+                                       transcript_file.getvalue(), transcript_file.name)
+        results = job_result(job)
+
+    if results is not None:
+        revision_note(results["revision"])
         st.markdown("### 📄 Earnings Call Summary")
-        st.write(transcript_summary)
+        with tracing.capture() as stream_spans:
+            st.write_stream(summarize_text_stream(results["document"], "earnings call transcript"))
         
         # Perform Sentiment Analysis
-        sentiment_result = ensemble_sentiment_analysis(transcript_text)
+        sentiment_result = results["sentiment"]
         positive_score = sentiment_result["positive"]
         neutral_score = sentiment_result["neutral"]
         negative_score = sentiment_result["negative"]
@@ -115,5 +260,60 @@ elif page == "Sentiment Analysis":
         
         st.plotly_chart(fig, use_container_width=True)
 
-    
+        # Sentence-level breakdown per speaker
+        st.markdown("### 🗣️ Sentiment by Speaker")
+        by_speaker = results["by_speaker"]
+        st.write(by_speaker)
+        fig = px.bar(by_speaker.reset_index(), x="speaker", y=["positive", "neutral", "negative"], barmode="stack",
+                     color_discrete_map={"positive": "#2ECC71", "neutral": "#F39C12", "negative": "#E74C3C"})
+        st.plotly_chart(fig, use_container_width=True)
+
+        timing_panel(results["spans"] + stream_spans)
+
+elif page == "Search":
+    st.title("🔎 Search Reports & Transcripts")
+    indexed = search_index.documents()
+    st.caption(f"{len(indexed)} analyzed documents indexed ({indexed['pages'].sum() if len(indexed) else 0} pages).")
+    mode = st.radio("Search in", ["Text", "Metrics"], horizontal=True)
+
+    if mode == "Text":
+        query = st.text_input("Words or phrase", placeholder="e.g. supply chain headwinds")
+        kind = st.selectbox("Documents", ["All", "Reports", "Transcripts"])
+        kind = {"Reports": "report", "Transcripts": "transcript"}.get(kind)
+        if query:
+            started = time.perf_counter()
+            try:
+                matching = search_index.documents_matching(query, kind=kind)
+                hits = search_index.search_text(query, kind=kind, limit=50)
+            except ValueError as e:
+                st.error(str(e))
+                matching = hits = None
+            if matching is not None:
+                st.caption(f"{len(matching)} matching document(s) in {(time.perf_counter() - started) * 1000:.1f} ms")
+                st.markdown("### 📚 Matching Documents")
+                st.write(matching)
+                st.markdown("### 📝 Best Matching Pages")
+                for hit in hits.itertuples():
+                    snippet = hit.snippet.replace("\n", " ")
+                    st.markdown(f"**{hit.company or hit.document}** · {hit.document}, page {hit.page}  \n{snippet}")
+    else:
+        metric_names = search_index.indexed_metrics()
+        if not metric_names:
+            st.info("No metrics indexed yet. Analyze a financial report first.")
+        else:
+            col1, col2, col3, col4 = st.columns(4)
+            metric = col1.selectbox("Metric", metric_names)
+            year = col2.number_input("Fiscal year (0 = any)", min_value=0, max_value=2100, value=0, step=1)
+            condition = col3.selectbox("Value", ["Any", "Negative", "Positive", "At least", "At most"])
+            threshold = col4.number_input("Threshold", value=0.0, disabled=condition not in ("At least", "At most"))
+            bounds = {"Negative": (None, 0.0), "Positive": (0.0, None),
+                      "At least": (threshold, None), "At most": (None, threshold)}.get(condition, (None, None))
+            started = time.perf_counter()
+            rows = search_index.search_metrics(metric, year=int(year) or None, min_value=bounds[0],
+                                               max_value=bounds[1])
+            if condition in ("Negative", "Positive"):
+                rows = rows[rows["value"] != 0]  # Bounds are inclusive
+            st.caption(f"{len(rows)} matching row(s) in {(time.perf_counter() - started) * 1000:.1f} ms")
+            st.write(rows)
+
 st.sidebar.info("AI-Powered Financial Report Summarization & Benchmarking for CFOs")
@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Background jobs for the dashboard: long analyses run on a shared thread pool while the page keeps
+# rendering, and finished results are memoized by key (file hash + inputs) so reruns reuse them.
+JOB_WORKERS = 4
+MAX_JOBS = 64  # Finished jobs kept for reuse; the oldest are dropped first
+
+
+class Job:
+    """One background task. The task reports progress through report(); the page polls it."""
+
+    def __init__(self, key):
+        self.key = key
+        self.progress = 0.0
+        self.message = "Queued"
+        self.started = time.time()
+        self.finished = None
+        self.future = None
+
+    def report(self, progress, message):
+        self.progress = max(0.0, min(1.0, progress))
+        self.message = message
+
+    @property
+    def done(self):
+        return self.future is not None and self.future.done()
+
+    @property
+    def error(self):
+        return self.future.exception() if self.done else None
+
+    def result(self):
+        """The task's return value (raises the task's error). Only call once the job is done."""
+        return self.future.result()
+
+
+class JobManager:
+    """
+    Runs jobs on a thread pool, at most one per key. Finished jobs, failed ones included, are kept and returned
+    by submit until they are evicted or discarded, so a failing analysis is not re-run on every page rerun.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, max_jobs=MAX_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_jobs = max_jobs
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        Returns the job for `key`, starting func(job, *args, **kwargs) in the background unless a job with
+        that key is already running or finished (successfully or not; discard() a failed job to retry it).
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                self._jobs.move_to_end(key)
+                return job
+
+            job = Job(key)
+            job.future = self._executor.submit(self._run, job, func, args, kwargs)
+            self._jobs[key] = job
+            self._evict()
+            return job
+
+    @staticmethod
+    def _run(job, func, args, kwargs):
+        job.report(0.0, "Running")
+        try:
+            result = func(job, *args, **kwargs)
+            job.report(1.0, "Done")
+            return result
+        finally:
+            job.finished = time.time()
+
+    def get(self, key):
+        """The job for `key`, or None."""
+        with self._lock:
+            return self._jobs.get(key)
+
+    def discard(self, key):
+        """Forgets the job for `key`, so the next submit starts it again. A running job is left to finish."""
+        with self._lock:
+            self._jobs.pop(key, None)
+
+    def _evict(self):
+        finished = [key for key, job in self._jobs.items() if job.done]
+        for key in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[key]
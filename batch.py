@@ -0,0 +1,314 @@
+"""
+Headless batch analysis of financial reports and earnings call transcripts.
+
+Input is either a directory of PDFs (files with "transcript" in the name are analysed as transcripts,
+all others as reports) or a manifest file (.csv, .json or .jsonl) with one job per row:
+
+    id, report, transcript, company, peers
+
+where `peers` is a comma-separated peer group (a list in JSON). Every field except one of report /
+transcript is optional; relative paths are resolved against the manifest's directory.
+
+Each finished job is written to OUTPUT/<job id>/ (result.json plus CSV tables) and recorded in
+OUTPUT/checkpoint.jsonl. Re-running the same command skips jobs that already finished with the same
+inputs, so an interrupted run resumes where it stopped; failed jobs are retried.
+
+Usage:
+    python batch.py dataset/ --output results/ [--peers "Walmart, Target"] [--workers 4]
+    python batch.py filings.csv --output results/ [--no-resume]
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from Data_retrieval import PdfDocument, extract_company_name_llm, extract_key_metrics, store_metrics
+from pipeline import Pipeline
+import ratios
+import revisions
+import search_index
+from sentiment_analyzer import ensemble_sentiment_analysis
+from sentiment_engine import analyze_sentiment, aggregate_sentiment
+from summarizer import summarize_text, summarize_financial_metrics, summarize_comparison, compare_metrics
+
+# Jobs run in threads: PDF parsing already fans out to worker processes, and LLM requests must share
+# llm_client's process-wide rate limits, which separate job processes would each exceed on their own.
+BATCH_WORKERS = 4
+CHECKPOINT_FILE = "checkpoint.jsonl"
+
+
+def _slug(name):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("_") or "job"
+
+
+def _split_peers(peers):
+    if isinstance(peers, str):
+        peers = peers.split(",")
+    return [peer.strip() for peer in peers or [] if peer.strip()]
+
+
+def jobs_from_directory(directory, peers=None):
+    """
+    One job per PDF in `directory`; the same peer group applies to every report. File names that map to the
+    same job id ("a b.pdf" and "a_b.pdf") get numbered ids ("a_b", "a_b-2") in file name order.
+    """
+    jobs, ids = [], set()
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(".pdf"):
+            continue
+        path = os.path.join(directory, name)
+        kind = "transcript" if "transcript" in name.lower() else "report"
+        job_id = base_id = _slug(os.path.splitext(name)[0])
+        n = 1
+        while job_id in ids:
+            n += 1
+            job_id = f"{base_id}-{n}"
+        ids.add(job_id)
+        jobs.append({"id": job_id, kind: path, "peers": _split_peers(peers)})
+    return jobs
+
+
+def jobs_from_manifest(manifest_path, peers=None):
+    """Reads jobs from a .csv, .json (list of objects) or .jsonl manifest."""
+    with open(manifest_path, encoding="utf-8") as f:
+        if manifest_path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        elif manifest_path.lower().endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = json.load(f)
+
+    base = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    for i, row in enumerate(rows):
+        job = {"peers": _split_peers(row.get("peers") or peers)}
+        for kind in ("report", "transcript"):
+            if row.get(kind):
+                job[kind] = os.path.join(base, row[kind])
+        if "report" not in job and "transcript" not in job:
+            raise ValueError(f"Manifest row {i + 1} has neither a report nor a transcript")
+        if row.get("company"):
+            job["company"] = row["company"].strip()
+        source = job.get("report") or job["transcript"]
+        job["id"] = _slug(row.get("id") or os.path.splitext(os.path.basename(source))[0])
+        jobs.append(job)
+
+    duplicates = {job["id"] for job in jobs if sum(other["id"] == job["id"] for other in jobs) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate job ids in manifest: {', '.join(sorted(duplicates))}")
+    return jobs
+
+
+def job_fingerprint(job):
+    """Hash of the job's input files and settings; a changed input invalidates its checkpoint."""
+    digest = hashlib.sha256()
+    for kind in ("report", "transcript"):
+        if kind in job:
+            with open(job[kind], "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    digest.update(json.dumps({"company": job.get("company"), "peers": job["peers"]}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class Checkpoint:
+    """Append-only log of finished jobs; the last line per job id wins."""
+
+    def __init__(self, output_dir):
+        self.path = os.path.join(output_dir, CHECKPOINT_FILE)
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Torn last line from an interrupted write
+                    self.entries[entry["id"]] = entry
+
+    def is_done(self, job_id, fingerprint):
+        entry = self.entries.get(job_id)
+        return entry is not None and entry["status"] == "done" and entry["fingerprint"] == fingerprint
+
+    def record(self, job_id, fingerprint, status, error=None, seconds=None):
+        entry = {"id": job_id, "fingerprint": fingerprint, "status": status, "error": error,
+                 "seconds": seconds, "finished": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.entries[job_id] = entry
+
+
+def _write_atomic(path, write):
+    tmp_path = f"{path}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def write_job_output(output_dir, job_id, result, tables):
+    """Writes result.json and one CSV per non-empty table into OUTPUT/<job id>/."""
+    job_dir = os.path.join(output_dir, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    for name, df in tables.items():
+        if df is not None and not df.empty:
+            _write_atomic(os.path.join(job_dir, f"{name}.csv"), lambda p, df=df: df.to_csv(p, index=False))
+
+    def dump(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, default=str)
+    _write_atomic(os.path.join(job_dir, "result.json"), dump)
+
+
+def _revision_summary(revision):
+    """What a revised document had to recompute, for result.json (see revisions.plan_revision)."""
+    return {"previous": revision["previous"], "pages": revision["pages"],
+            "changed_pages": len(revision["changed_pages"]), "artifacts": revision["artifacts"],
+            "stale_artifacts": revision["stale"]}
+
+
+def analyze_report(job, result, tables):
+    """Company name, key metrics, summaries and (with a peer group) the competitor comparison."""
+    # The first pass fills the page cache; the stages then stream the pages instead of sharing one string
+    document = PdfDocument(job["report"])
+    page_count = document.scan()
+    if not page_count:
+        raise ValueError(f"No text extracted from {job['report']}")
+    result["report_revision"] = _revision_summary(revisions.plan_revision(document, kinds=("summary", "metrics")))
+
+    pipeline = Pipeline()
+    if job.get("company"):
+        pipeline.add("company_name", lambda: job["company"])
+    else:
+        pipeline.add("company_name", extract_company_name_llm, document.head(2000))
+    pipeline.add("key_metrics", extract_key_metrics, document)
+    pipeline.add("summary_text", summarize_text, document, "financial report")
+    pipeline.add("metrics_summary", summarize_financial_metrics, deps=["key_metrics"])
+    results = pipeline.run()
+
+    company_name = results["company_name"]
+    result.update(company=company_name, pages=page_count, report_summary=results["summary_text"],
+                  metrics_summary=results["metrics_summary"])
+    tables["metrics"] = results["key_metrics"]
+    if results["key_metrics"] is not None:
+        store_metrics(results["key_metrics"], company_name, "report")
+    search_index.index_analysis(document, "report", company=company_name, metrics=results["key_metrics"])
+
+    if job["peers"]:
+        df_comparison = compare_metrics(company_name, job["peers"])
+        if df_comparison is None or df_comparison.empty:
+            result["comparison_summary"] = None
+        else:
+            main_company_data = df_comparison[df_comparison["Company"] == company_name]
+            competitor_data = df_comparison[df_comparison["Company"] != company_name]
+            peer_ratios, ranks = ratios.peer_group_ratios(df_comparison)
+            result["comparison_summary"] = summarize_comparison(main_company_data, competitor_data,
+                                                                peer_ratios, ranks)
+            if not peer_ratios.empty:
+                tables["peer_ratios"] = ratios.latest_ratios(peer_ratios).reset_index()
+                tables["peer_ranks"] = ranks.reset_index()
+        tables["comparison"] = df_comparison
+
+
+def analyze_transcript(job, result, tables):
+    """Transcript summary, ensemble sentiment and the per-speaker breakdown."""
+    document = PdfDocument(job["transcript"])
+    document.scan()
+    if not document.head(1):
+        raise ValueError(f"No text extracted from {job['transcript']}")
+    result["transcript_revision"] = _revision_summary(revisions.plan_revision(document, kinds=("summary", "sentiment")))
+    result["transcript_summary"] = summarize_text(document, "earnings call transcript")
+    result["sentiment"] = ensemble_sentiment_analysis(document)
+    tables["sentiment_by_speaker"] = aggregate_sentiment(analyze_sentiment(document), by="speaker").reset_index()
+    search_index.index_analysis(document, "transcript", company=result.get("company") or job.get("company"))
+
+
+def process_job(job, output_dir):
+    """Runs one job and writes its outputs. Raises on failure."""
+    result = {"id": job["id"], "inputs": {k: job[k] for k in ("report", "transcript", "company", "peers") if k in job}}
+    tables = {}
+    if "report" in job:
+        analyze_report(job, result, tables)
+    if "transcript" in job:
+        analyze_transcript(job, result, tables)
+    write_job_output(output_dir, job["id"], result, tables)
+    return result
+
+
+def run_batch(jobs, output_dir, max_workers=BATCH_WORKERS, resume=True):
+    """
+    Processes jobs with a thread pool, checkpointing each finished job.
+    :return: Dict with the ids of done, skipped and failed jobs
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = Checkpoint(output_dir)
+    summary = {"done": [], "skipped": [], "failed": []}
+
+    pending = []
+    for job in jobs:
+        try:
+            fingerprint = job_fingerprint(job)
+        except OSError as e:
+            print(f"[failed] {job['id']}: {e}")
+            checkpoint.record(job["id"], None, "failed", error=f"{type(e).__name__}: {e}")
+            summary["failed"].append(job["id"])
+            continue
+        if resume and checkpoint.is_done(job["id"], fingerprint):
+            summary["skipped"].append(job["id"])
+        else:
+            pending.append((job, fingerprint))
+    print(f"{len(pending)} job(s) to run, {len(summary['skipped'])} already done.")
+
+    def run(job, fingerprint):
+        start = time.perf_counter()
+        try:
+            process_job(job, output_dir)
+        except Exception as e:
+            checkpoint.record(job["id"], fingerprint, "failed", error=f"{type(e).__name__}: {e}",
+                              seconds=round(time.perf_counter() - start, 2))
+            raise
+        checkpoint.record(job["id"], fingerprint, "done", seconds=round(time.perf_counter() - start, 2))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run, job, fingerprint): job["id"] for job, fingerprint in pending}
+        for future in as_completed(futures):
+            job_id = futures[future]
+            try:
+                future.result()
+                summary["done"].append(job_id)
+                print(f"[done] {job_id}")
+            except Exception as e:
+                summary["failed"].append(job_id)
+                print(f"[failed] {job_id}: {e}")
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="directory of PDFs or a .csv / .json / .jsonl manifest")
+    parser.add_argument("--output", required=True, help="output directory")
+    parser.add_argument("--peers", help="comma-separated peer group for reports without one in the manifest")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="jobs processed concurrently")
+    parser.add_argument("--no-resume", action="store_true", help="re-run jobs that already finished")
+    args = parser.parse_args(argv)
+
+    if os.path.isdir(args.input):
+        jobs = jobs_from_directory(args.input, args.peers)
+    else:
+        jobs = jobs_from_manifest(args.input, args.peers)
+
+    summary = run_batch(jobs, args.output, max_workers=args.workers, resume=not args.no_resume)
+    print(f"Finished: {len(summary['done'])} done, {len(summary['skipped'])} skipped, "
+          f"{len(summary['failed'])} failed.")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
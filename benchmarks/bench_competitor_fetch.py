@@ -0,0 +1,117 @@
+"""
+Compares the old one-at-a-time competitor loop with the concurrent peer fetch engine
+(Data_retrieval.fetch_peer_metrics) against a local stub of the Yahoo Finance endpoints.
+
+Each company costs one ticker search plus three statement requests (income, balance sheet,
+cash flow), mirroring what yfinance does for fetch_financial_metrics.
+
+Usage:
+    python benchmarks/bench_competitor_fetch.py [--companies N] [--latency MS]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["FINSIGHT_CACHE_DIR"] = tempfile.mkdtemp()  # Cold ticker / fundamentals cache on every run
+
+import Data_retrieval  # noqa: E402
+
+STATEMENTS = ("financials", "balance_sheet", "cashflow")
+
+
+class StubYahooHandler(BaseHTTPRequestHandler):
+    """Answers ticker searches and statement requests after a fixed delay."""
+    latency = 0.1
+    protocol_version = "HTTP/1.1"  # Keep-alive, so pooled connections are reused
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path.endswith("/search"):
+            symbol = query["q"][0].upper().replace(" ", "")[:4]
+            body = {"quotes": [{"symbol": symbol}]}
+        else:
+            body = {"ticker": query.get("ticker", [""])[0], "rows": {"Total Revenue": [1.0, 2.0, 3.0]}}
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server(latency):
+    StubYahooHandler.latency = latency
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubYahooHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def make_statement_fetcher(base_url, get):
+    """Stand-in for fetch_financial_metrics: three statement requests, then a long-format frame."""
+    def fetch(ticker, years=3):
+        for statement in STATEMENTS:
+            get(f"{base_url}/{statement}", params={"ticker": ticker}, timeout=Data_retrieval.HTTP_TIMEOUT).json()
+        return pd.DataFrame({"Year": [2023, 2022, 2021], "Metric": "Revenue", "Value": [3.0, 2.0, 1.0]})
+    return fetch
+
+
+def serial_baseline(companies, base_url):
+    """The previous compare_metrics loop: fresh connection per request, one company at a time."""
+    fetch = make_statement_fetcher(base_url, requests.get)
+    results = []
+    for company in companies:
+        res = requests.get(f"{base_url}/v1/finance/search", params={"q": company},
+                           headers={'User-Agent': 'Mozilla/5.0'})
+        ticker = res.json()["quotes"][0]["symbol"]
+        data = fetch(ticker)
+        data["Company"] = company
+        results.append(data)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--companies", type=int, default=15, help="size of the peer group")
+    parser.add_argument("--latency", type=float, default=100, help="stub server latency per request in ms")
+    parser.add_argument("--workers", type=int, default=Data_retrieval.FETCH_WORKERS, help="concurrent fetches")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.latency / 1000)
+    companies = [f"Company {i}" for i in range(args.companies)]
+    try:
+        start = time.perf_counter()
+        serial = serial_baseline(companies, base_url)
+        serial_time = time.perf_counter() - start
+
+        Data_retrieval.YAHOO_SEARCH_URL = f"{base_url}/v1/finance/search"
+        Data_retrieval.fetch_financial_metrics = make_statement_fetcher(base_url, Data_retrieval.get_http_session().get)
+        start = time.perf_counter()
+        concurrent = Data_retrieval.fetch_peer_metrics(companies, max_workers=args.workers)
+        concurrent_time = time.perf_counter() - start
+    finally:
+        server.shutdown()
+
+    assert [df["Company"].iloc[0] for df in concurrent] == [df["Company"].iloc[0] for df in serial]
+    print(f"{args.companies} companies, {args.latency:.0f} ms per request, {args.workers} workers")
+    print(f"serial loop:        {serial_time:5.2f} s")
+    print(f"fetch_peer_metrics: {concurrent_time:5.2f} s  ({serial_time / concurrent_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
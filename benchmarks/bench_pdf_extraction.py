@@ -0,0 +1,46 @@
+"""
+Compares serial and page-sharded parallel PDF text extraction on the bundled dataset.
+
+Usage:
+    python benchmarks/bench_pdf_extraction.py [--workers N] [--repeat R]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Data_retrieval import extract_pages_from_pdf  # noqa: E402
+
+
+def time_extraction(pdf_path, workers, repeat):
+    """Returns (best wall time in seconds, page count) over `repeat` runs."""
+    best = float("inf")
+    pages = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pages = extract_pages_from_pdf(pdf_path, workers=workers, use_cache=False)
+        best = min(best, time.perf_counter() - start)
+    return best, len(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes for the parallel path")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per file (best time is reported)")
+    parser.add_argument("--dataset", default=os.path.join(ROOT, "dataset"), help="directory with PDF files")
+    args = parser.parse_args()
+
+    print(f"{'file':<32} {'pages':>5} {'serial s':>9} {'parallel s':>10} {'pages/s':>9} {'speedup':>8}")
+    for pdf_path in sorted(glob.glob(os.path.join(args.dataset, "*.pdf"))):
+        serial, pages = time_extraction(pdf_path, 1, args.repeat)
+        parallel, _ = time_extraction(pdf_path, args.workers, args.repeat)
+        print(f"{os.path.basename(pdf_path):<32} {pages:>5} {serial:>9.2f} {parallel:>10.2f} "
+              f"{pages / parallel:>9.1f} {serial / parallel:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
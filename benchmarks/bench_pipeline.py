@@ -0,0 +1,244 @@
+"""
+End-to-end benchmark of the report -> metrics -> comparison -> sentiment flow.
+
+Runs every stage over the bundled dataset plus synthetic reports scaled up to 10x / 100x the pages
+of a base PDF. The LLM is replaced by the offline stub backend (llm_backends.StubBackend) and Yahoo
+Finance by in-process stubs, both with configurable latency, so results depend only on local code.
+
+Per stage and document it records wall time, peak RSS and throughput, and writes everything to a
+JSON file. Pass an earlier result file with --baseline to compare two commits.
+
+Usage:
+    python benchmarks/bench_pipeline.py [--scales 10 100] [--llm-latency MS] [--baseline OLD.json]
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import pandas as pd
+from PyPDF2 import PdfReader, PdfWriter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["FINSIGHT_CACHE_DIR"] = tempfile.mkdtemp()  # Cold caches on every run
+os.environ["FINSIGHT_LLM_BACKEND"] = "stub"
+os.environ.setdefault("FINSIGHT_LLM_RPM", "1000000")  # Measure the pipeline, not the rate limiter
+os.environ.setdefault("FINSIGHT_LLM_TPM", "1000000000")
+
+import Data_retrieval  # noqa: E402
+import llm_backends  # noqa: E402
+import llm_cache  # noqa: E402
+import llm_client  # noqa: E402
+from pipeline import Pipeline  # noqa: E402
+from sentiment_analyzer import ensemble_sentiment_analysis  # noqa: E402
+from summarizer import compare_metrics, summarize_text  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+RSS_SAMPLE_INTERVAL = 0.01  # Seconds
+
+
+def current_rss():
+    """Resident set size of this process in bytes."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # No procfs (macOS): fall back to the lifetime peak (bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class PeakRss:
+    """Context manager that samples RSS in a background thread and keeps the maximum."""
+
+    def __enter__(self):
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_INTERVAL):
+            self.peak = max(self.peak, current_rss())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss())
+
+
+def run_stage(name, func, items, unit):
+    """Runs one stage with a cold LLM cache and returns its measurements."""
+    llm_cache.clear()
+    requests_before = llm_client.stats()["requests"]
+    with PeakRss() as rss, contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+    return result, {
+        "stage": name,
+        "wall_s": round(elapsed, 4),
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+        "items": items,
+        "unit": unit,
+        "throughput": round(items / elapsed, 2) if elapsed > 0 else None,
+        "llm_requests": llm_client.stats()["requests"] - requests_before,
+    }
+
+
+def install_market_stubs(latency):
+    """Replaces the Yahoo Finance ticker search and statement fetch with deterministic local stubs."""
+    def get_ticker_from_search(company_name):
+        time.sleep(latency)
+        return company_name.upper().replace(" ", "")[:5]
+
+    def fetch_financial_metrics(ticker_symbol, years=3):
+        time.sleep(latency * 3)  # Income statement, balance sheet and cash flow requests
+        metrics = Data_retrieval.YAHOO_METRIC_ORDER
+        seed = sum(map(ord, ticker_symbol))
+        return pd.DataFrame({
+            "Year": [2023 - i for _ in metrics for i in range(years)],
+            "Metric": [metric for metric in metrics for _ in range(years)],
+            "Value": [float(seed * (j + 1) * (years - i)) for j in range(len(metrics)) for i in range(years)],
+        })
+
+    Data_retrieval.get_ticker_from_search = get_ticker_from_search
+    Data_retrieval.fetch_financial_metrics = fetch_financial_metrics
+
+
+def build_scaled_pdf(base_path, factor, out_dir):
+    """Writes a synthetic report with the pages of `base_path` repeated `factor` times."""
+    reader = PdfReader(base_path)
+    writer = PdfWriter()
+    for _ in range(factor):
+        for page in reader.pages:
+            writer.add_page(page)
+    stem = os.path.splitext(os.path.basename(base_path))[0]
+    out_path = os.path.join(out_dir, f"{stem} x{factor}.pdf")
+    with open(out_path, "wb") as f:
+        writer.write(f)
+    return out_path
+
+
+def run_document_pipeline(pdf_path):
+    """The dashboard's report flow: a PdfDocument scanned once, then three stages streaming it concurrently."""
+    document = Data_retrieval.PdfDocument(pdf_path)
+    document.scan()
+    pipeline = Pipeline()
+    pipeline.add("key_metrics", Data_retrieval.extract_key_metrics, document)
+    pipeline.add("summary", summarize_text, document)
+    pipeline.add("sentiment", ensemble_sentiment_analysis, document)
+    return pipeline.run()
+
+
+def benchmark_document(pdf_path):
+    """Runs the per-document stages on one PDF, on the whole text and streamed from a PdfDocument."""
+    page_count = len(PdfReader(pdf_path).pages)
+    text, extract = run_stage("extract_text_from_pdf",
+                              lambda: Data_retrieval.extract_text_from_pdf(pdf_path, use_cache=False),
+                              page_count, "pages")
+    pages = Data_retrieval.extract_pages_from_pdf(pdf_path)
+    chars = len(text)
+    stages = [extract]
+    stages.append(run_stage("extract_key_metrics_llm",
+                            lambda: Data_retrieval.extract_key_metrics_llm(text, pages=pages), chars, "chars")[1])
+    stages.append(run_stage("summarize_text", lambda: summarize_text(text), chars, "chars")[1])
+    stages.append(run_stage("ensemble_sentiment_analysis", lambda: ensemble_sentiment_analysis(text), chars, "chars")[1])
+    stages.append(run_stage("PdfDocument.scan", lambda: Data_retrieval.PdfDocument(pdf_path, use_cache=False).scan(),
+                            page_count, "pages")[1])
+    stages.append(run_stage("document_pipeline", lambda: run_document_pipeline(pdf_path), page_count, "pages")[1])
+    return {"document": os.path.basename(pdf_path), "pages": page_count, "chars": chars, "stages": stages}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_results(results, baseline=None):
+    """Prints a table of stage timings, with the ratio to a baseline run where one matches."""
+    previous = {}
+    for doc in (baseline or {}).get("documents", []):
+        for stage in doc["stages"]:
+            previous[doc["document"], stage["stage"]] = stage
+    header = f"{'document':<34} {'stage':<28} {'wall s':>8} {'peak MB':>8} {'throughput':>16}"
+    print(header + (f" {'vs base':>8}" if baseline else ""))
+    for doc in results["documents"]:
+        for stage in doc["stages"]:
+            line = (f"{doc['document'][:34]:<34} {stage['stage']:<28} {stage['wall_s']:>8.3f} "
+                    f"{stage['peak_rss_mb']:>8.1f} {stage['throughput'] or 0:>10.1f} {stage['unit'] + '/s':<7}")
+            old = previous.get((doc["document"], stage["stage"]))
+            if old and stage["wall_s"] > 0:
+                line += f" {old['wall_s'] / stage['wall_s']:>7.2f}x"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dataset", default=os.path.join(ROOT, "dataset"), help="directory with PDF files")
+    parser.add_argument("--base", default=os.path.join(ROOT, "dataset", "goldman 2024.pdf"),
+                        help="PDF whose pages are repeated for the synthetic reports")
+    parser.add_argument("--scales", type=int, nargs="*", default=[10, 100], help="page multipliers for synthetic reports")
+    parser.add_argument("--llm-latency", type=float, default=50, help="stub LLM latency per request in ms")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fraction of stub LLM requests that fail")
+    parser.add_argument("--net-latency", type=float, default=20, help="stub Yahoo latency per request in ms")
+    parser.add_argument("--peers", type=int, default=5, help="competitors in the compare_metrics stage")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/pipeline-<commit>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare against")
+    args = parser.parse_args()
+
+    llm_client.set_backend(llm_backends.StubBackend(latency=args.llm_latency / 1000, error_rate=args.llm_error_rate))
+    install_market_stubs(args.net_latency / 1000)
+
+    synthetic_dir = tempfile.mkdtemp()
+    pdf_paths = sorted(glob.glob(os.path.join(args.dataset, "*.pdf")))
+    pdf_paths += [build_scaled_pdf(args.base, factor, synthetic_dir) for factor in args.scales]
+
+    documents = []
+    for pdf_path in pdf_paths:
+        print(f"Benchmarking {os.path.basename(pdf_path)} ...", file=sys.stderr)
+        documents.append(benchmark_document(pdf_path))
+
+    peers = [f"Peer {i}" for i in range(args.peers)]
+    _, comparison = run_stage("compare_metrics", lambda: compare_metrics("Main Company", peers),
+                              args.peers + 1, "companies")
+    documents.append({"document": "(peer group)", "pages": 0, "chars": 0, "stages": [comparison]})
+
+    commit = git_commit()
+    results = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "documents": documents,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"pipeline-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Import-time profile of the project's modules.
+
+Imports each module in a fresh interpreter with `python -X importtime`, then reports the total import
+time, the peak RSS after importing, and the heaviest top-level packages it pulled in.
+
+Usage:
+    python benchmarks/profile_imports.py [MODULE ...] [--top N] [--json OUT.json]
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES = ["Data_retrieval", "summarizer", "sentiment_analyzer", "sentiment_engine", "llm_client",
+           "metrics_store", "pdf_extract", "batch"]
+
+# Prints peak RSS in KB once the import finished (ru_maxrss is bytes on macOS)
+PROBE = ("import resource, sys; import {module}; "
+         "rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss; "
+         "print(rss // 1024 if sys.platform == 'darwin' else rss)")
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def profile_module(module):
+    """Returns {"module", "import_ms", "peak_rss_mb", "packages": {top-level package: cumulative ms}}."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE.format(module=module)],
+                          capture_output=True, text=True, env=env, cwd=ROOT)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr.strip().splitlines()[-1]}")
+
+    # Children are listed before their parent, indented two more spaces per level
+    packages, children = {}, []
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative_us, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        if indent == 3:
+            children.append((name, cumulative_us))
+        elif indent == 1:
+            if name == module:
+                total_us = cumulative_us
+                for child, child_us in children:
+                    top = child.split(".")[0]
+                    packages[top] = packages.get(top, 0) + child_us / 1000
+            children = []
+    return {
+        "module": module,
+        "import_ms": round(total_us / 1000, 1),
+        "peak_rss_mb": round(int(proc.stdout.strip()) / 1024, 1),
+        "packages": {name: round(ms, 1) for name, ms in sorted(packages.items(), key=lambda kv: -kv[1])},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=MODULES, help="modules to profile")
+    parser.add_argument("--top", type=int, default=5, help="heaviest packages listed per module")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'module':<20} {'import ms':>10} {'peak MB':>8}  heaviest imports (cumulative ms)")
+    for module in args.modules:
+        try:
+            result = profile_module(module)
+        except RuntimeError as e:
+            print(f"{module:<20} {str(e).splitlines()[-1]}")
+            continue
+        results.append(result)
+        heaviest = ", ".join(f"{name} {ms:.0f}" for name, ms in list(result["packages"].items())[:args.top])
+        print(f"{module:<20} {result['import_ms']:>10.1f} {result['peak_rss_mb']:>8.1f}  {heaviest}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import llm_cache
+
+# Interchangeable LLM backends behind llm_client: the real Gemini API and a deterministic offline stub
+
+
+STREAM_WORDS = 4  # Words per streamed piece from the stub
+
+
+class TransientBackendError(Exception):
+    """A retryable failure (used by the stub to simulate quota errors and outages)."""
+
+
+class GeminiBackend:
+    """Google Gemini through google.generativeai."""
+    name = "gemini"
+
+    def __init__(self):
+        import google.generativeai as genai
+        from google.api_core import exceptions as google_exceptions
+        from config import GEMINI_API_KEY
+
+        genai.configure(api_key=GEMINI_API_KEY)
+        self._genai = genai
+        self._models = {}
+        self._lock = threading.Lock()
+        self.retryable_errors = (
+            TransientBackendError,
+            google_exceptions.ResourceExhausted,      # 429 quota / rate limit
+            google_exceptions.TooManyRequests,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.InternalServerError,
+            google_exceptions.DeadlineExceeded,
+        )
+
+    def _model(self, model_name):
+        with self._lock:
+            if model_name not in self._models:
+                self._models[model_name] = self._genai.GenerativeModel(model_name)
+            return self._models[model_name]
+
+    def generate(self, model_name, prompt, generation_config=None):
+        return self._model(model_name).generate_content(prompt, generation_config=generation_config).text
+
+    def stream(self, model_name, prompt, generation_config=None):
+        """Yields the response text in pieces as Gemini produces them."""
+        response = self._model(model_name).generate_content(prompt, generation_config=generation_config, stream=True)
+        for chunk in response:
+            if chunk.parts:
+                yield chunk.text
+
+
+class StubBackend:
+    """
+    Deterministic offline backend for benchmarks and regression runs.
+    Replays recorded responses when a recording exists for the exact request; otherwise synthesizes
+    a reply of the right shape for each call site (metrics JSON, sentiment counts, company name, summary)
+    from a hash of the prompt. Latency and error rate are configurable and drawn from a seeded RNG.
+    """
+    name = "stub"
+    retryable_errors = (TransientBackendError,)
+
+    def __init__(self, recordings=None, latency=0.0, jitter=0.0, error_rate=0.0, seed=0, stream_interval=0.0):
+        """
+        :param recordings: Path of a JSONL recording file (see llm_client RECORD_PATH) or a dict of key -> response.
+        :param latency: Simulated seconds per request.
+        :param jitter: Extra random seconds per request, uniform in [0, jitter].
+        :param error_rate: Probability that a request fails with TransientBackendError.
+        :param seed: RNG seed for latency jitter and errors.
+        :param stream_interval: Simulated seconds between streamed pieces.
+        """
+        self.recordings = load_recordings(recordings) if isinstance(recordings, str) else dict(recordings or {})
+        self.latency, self.jitter, self.error_rate = latency, jitter, error_rate
+        self.stream_interval = stream_interval
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls):
+        """Builds a stub from FINSIGHT_STUB_* environment variables."""
+        return cls(
+            recordings=os.environ.get("FINSIGHT_STUB_RECORDINGS"),
+            latency=float(os.environ.get("FINSIGHT_STUB_LATENCY_MS", "0")) / 1000,
+            jitter=float(os.environ.get("FINSIGHT_STUB_JITTER_MS", "0")) / 1000,
+            error_rate=float(os.environ.get("FINSIGHT_STUB_ERROR_RATE", "0")),
+            seed=int(os.environ.get("FINSIGHT_STUB_SEED", "0")),
+            stream_interval=float(os.environ.get("FINSIGHT_STUB_STREAM_INTERVAL_MS", "0")) / 1000,
+        )
+
+    def generate(self, model_name, prompt, generation_config=None):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+            fail = self._rng.random() < self.error_rate
+        time.sleep(delay)
+        if fail:
+            raise TransientBackendError("Simulated backend error")
+
+        key = llm_cache.fingerprint(model_name, prompt, generation_config)
+        if key in self.recordings:
+            return self.recordings[key]
+        return synthesize_response(prompt)
+
+    def stream(self, model_name, prompt, generation_config=None):
+        """Yields the reply a few words at a time; the request latency applies before the first piece."""
+        words = re.findall(r"\S+\s*", self.generate(model_name, prompt, generation_config))
+        for i in range(0, len(words), STREAM_WORDS):
+            if i:
+                time.sleep(self.stream_interval)
+            yield "".join(words[i:i + STREAM_WORDS])
+
+
+def synthesize_response(prompt):
+    """Deterministic reply whose format matches what the calling prompt asks for."""
+    seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12], 16)
+    rng = random.Random(seed)
+
+    if '"financials"' in prompt:
+        base = rng.uniform(1e9, 5e11)
+        financials = [{
+            "year": year,
+            "Revenue": round(base * growth),
+            "EBITDA": round(base * growth * 0.18),
+            "Net Profit": round(base * growth * 0.07),
+            "Total Assets": round(base * 1.1),
+            "Total Liabilities": round(base * 0.7),
+            "Equity": round(base * 0.4),
+            "Operating Cash Flow": round(base * growth * 0.15),
+            "Investing Cash Flow": -round(base * growth * 0.1),
+            "Financing Cash Flow": -round(base * growth * 0.03),
+        } for year, growth in ((2023, 1.1), (2022, 1.0), (2021, 0.9))]
+        return json.dumps({"financials": financials})
+
+    if '"positive"' in prompt:
+        match = re.search(r"following (\d+) numbered sentences", prompt)
+        total = int(match.group(1)) if match else rng.randint(10, 50)
+        positive = rng.randint(0, total)
+        negative = rng.randint(0, total - positive)
+        return json.dumps({"positive": positive, "neutral": total - positive - negative, "negative": negative})
+
+    if "Extract the company name" in prompt:
+        report = prompt.split("\n", 1)[-1]
+        first_line = next((line.strip() for line in report.splitlines() if line.strip()), "")
+        return first_line[:80] or f"Stub Company {seed % 1000}"
+
+    words = re.findall(r"[A-Za-z]{5,}", prompt)
+    picks = [rng.choice(words) for _ in range(12)] if words else ["figures"] * 12
+    return "\n".join(f"- Stub insight {i + 1}: {' '.join(picks[i * 3:i * 3 + 3])}." for i in range(4))
+
+
+def load_recordings(path):
+    """Reads a JSONL recording file into a dict of request fingerprint -> response text."""
+    recordings = {}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    recordings[entry["key"]] = entry["response"]
+    return recordings
+
+
+_record_lock = threading.Lock()
+
+
+def append_recording(path, key, model_name, prompt, response):
+    """Appends one request/response pair to a JSONL recording file."""
+    line = json.dumps({"key": key, "model": model_name, "prompt": prompt, "response": response})
+    with _record_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def backend_from_env():
+    """Returns the backend selected by FINSIGHT_LLM_BACKEND ("gemini", the default, or "stub")."""
+    name = os.environ.get("FINSIGHT_LLM_BACKEND", "gemini").lower()
+    if name == "stub":
+        return StubBackend.from_env()
+    if name == "gemini":
+        return GeminiBackend()
+    raise ValueError(f"Unknown LLM backend '{name}' (expected 'gemini' or 'stub')")
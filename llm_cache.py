@@ -0,0 +1,107 @@
+import dataclasses
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Gemini responses are stored in SQLite, keyed by a fingerprint of model, prompt and generation config
+CACHE_DIR = os.environ.get("FINSIGHT_CACHE_DIR", ".cache")
+LLM_CACHE_PATH = os.path.join(CACHE_DIR, "llm.sqlite")
+TTL_SECONDS = int(os.environ.get("FINSIGHT_LLM_CACHE_TTL_HOURS", "168")) * 3600
+MAX_CACHE_BYTES = int(os.environ.get("FINSIGHT_LLM_CACHE_MB", "64")) * 1024 * 1024
+
+_lock = threading.Lock()
+_connection = None
+_stats = {"hits": 0, "misses": 0}
+
+
+def _connect():
+    global _connection
+    if _connection is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        _connection = sqlite3.connect(LLM_CACHE_PATH, timeout=30, check_same_thread=False)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        _connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+    return _connection
+
+
+def _normalize_config(generation_config):
+    """Turns a GenerationConfig / dict / None into something JSON-serializable and order-independent."""
+    if generation_config is None:
+        return None
+    if dataclasses.is_dataclass(generation_config):
+        generation_config = dataclasses.asdict(generation_config)
+    return {k: v for k, v in dict(generation_config).items() if v is not None}
+
+
+def fingerprint(model_name, prompt, generation_config=None):
+    """Stable cache key for one LLM request."""
+    payload = json.dumps(
+        {"model": model_name, "prompt": prompt, "config": _normalize_config(generation_config)},
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get(key):
+    """Returns the cached response text for a fingerprint, or None if missing or expired."""
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        row = conn.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or now - row[1] > TTL_SECONDS:
+            _stats["misses"] += 1
+            return None
+        conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        conn.commit()
+        _stats["hits"] += 1
+        return row[0]
+
+
+def put(key, response_text):
+    """Stores a response text and evicts expired and least recently used entries."""
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, response, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, response_text, len(response_text.encode("utf-8")), now, now),
+        )
+        _evict(conn, now)
+        conn.commit()
+
+
+def _evict(conn, now):
+    conn.execute("DELETE FROM responses WHERE created < ?", (now - TTL_SECONDS,))
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+    if total <= MAX_CACHE_BYTES:
+        return
+    for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+        conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        total -= size
+        if total <= MAX_CACHE_BYTES:
+            break
+
+
+def stats():
+    """Returns hit / miss counters and the current size of the cache."""
+    with _lock:
+        conn = _connect()
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return dict(_stats, entries=entries, bytes=size)
+
+
+def clear():
+    """Removes every cached response and resets the counters."""
+    with _lock:
+        conn = _connect()
+        conn.execute("DELETE FROM responses")
+        conn.commit()
+        _stats.update(hits=0, misses=0)
@@ -0,0 +1,265 @@
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+import llm_backends
+import llm_cache
+import page_store
+import tracing
+
+# One process-wide LLM client: rate limits, bounded concurrency, retries, request coalescing and caching.
+# Requests go to a pluggable backend (llm_backends): Gemini by default, or the offline stub with FINSIGHT_LLM_BACKEND=stub
+MODEL_NAME = "gemini-pro"
+REQUESTS_PER_MINUTE = int(os.environ.get("FINSIGHT_LLM_RPM", "60"))
+TOKENS_PER_MINUTE = int(os.environ.get("FINSIGHT_LLM_TPM", "120000"))
+MAX_IN_FLIGHT = int(os.environ.get("FINSIGHT_LLM_MAX_IN_FLIGHT", "8"))
+MAX_RETRIES = 5
+BACKOFF_BASE = float(os.environ.get("FINSIGHT_LLM_BACKOFF", "1.0"))   # Seconds; doubled on every retry, plus jitter
+RECORD_PATH = os.environ.get("FINSIGHT_LLM_RECORD")  # Append every live response to this JSONL file for stub replay
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `per_minute` tokens per minute; acquire() blocks until tokens are free."""
+
+    def __init__(self, per_minute, capacity=None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity or per_minute
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        amount = min(amount, self.capacity)  # Oversized requests wait for a full bucket instead of forever
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_request_bucket = TokenBucket(REQUESTS_PER_MINUTE)
+_token_bucket = TokenBucket(TOKENS_PER_MINUTE)
+_in_flight = threading.BoundedSemaphore(MAX_IN_FLIGHT)
+_STREAM_END = object()  # Marks the end of a stream in stream_text's piece queue
+
+_lock = threading.Lock()
+_backend = None
+_pending = {}  # Fingerprint -> Future of the identical request already in flight
+_stats = {"requests": 0, "retries": 0, "coalesced": 0}
+
+
+def get_backend():
+    """Returns the active backend, creating the one selected by FINSIGHT_LLM_BACKEND on first use."""
+    global _backend
+    with _lock:
+        if _backend is None:
+            _backend = llm_backends.backend_from_env()
+        return _backend
+
+
+def set_backend(backend):
+    """Replaces the active backend (e.g. llm_backends.StubBackend(...) for offline runs) and returns the previous one."""
+    global _backend
+    with _lock:
+        previous, _backend = _backend, backend
+    return previous
+
+
+def _model_id(model_name):
+    """Fully qualified model name, as Gemini reports it; part of every cache key."""
+    return model_name if model_name.startswith("models/") else f"models/{model_name}"
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token) used for the tokens-per-minute budget."""
+    return len(text) // 4 + 1
+
+
+def _acquire_rate_limits(prompt):
+    _request_bucket.acquire()
+    _token_bucket.acquire(estimate_tokens(prompt))
+    with _lock:
+        _stats["requests"] += 1
+
+
+def _wait_before_retry(attempt, error, span):
+    """Sleeps with exponential backoff and jitter before retry number attempt + 1."""
+    delay = BACKOFF_BASE * 2 ** attempt * (1 + random.random())
+    print(f"LLM request failed ({type(error).__name__}), retrying in {delay:.1f}s")
+    with _lock:
+        _stats["retries"] += 1
+    span.set(retries=attempt + 1)
+    time.sleep(delay)
+
+
+def _call_with_backoff(backend, model_name, prompt, generation_config, span):
+    """Sends one request under the rate limits, retrying quota and transient errors with exponential backoff."""
+    for attempt in range(MAX_RETRIES):
+        _acquire_rate_limits(prompt)
+        try:
+            with _in_flight:
+                return backend.generate(model_name, prompt, generation_config)
+        except backend.retryable_errors as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            _wait_before_retry(attempt, e, span)
+
+
+def _cache_key(backend, model_id, prompt, generation_config):
+    # Keys of non-Gemini backends are namespaced so stub replies never pollute the cache of real responses
+    namespace = model_id if backend.name == "gemini" else f"{backend.name}:{model_id}"
+    return llm_cache.fingerprint(namespace, prompt, generation_config)
+
+
+def _store_response(backend, key, model_id, prompt, generation_config, text):
+    llm_cache.put(key, text)
+    if RECORD_PATH and backend.name != "stub":
+        llm_backends.append_recording(
+            RECORD_PATH, llm_cache.fingerprint(model_id, prompt, generation_config), model_id, prompt, text)
+
+
+def generate_text(prompt, generation_config=None, refresh=False, model_name=MODEL_NAME, keep=False):
+    """
+    Sends a prompt to the active LLM backend and returns the response text.
+    Responses are cached (llm_cache), identical prompts already in flight share one request,
+    and requests are throttled to REQUESTS_PER_MINUTE / TOKENS_PER_MINUTE with at most MAX_IN_FLIGHT at a time.
+    :param prompt: The prompt text.
+    :param generation_config: Optional generation config passed through to the backend.
+    :param refresh: Skip the cache lookup and overwrite the entry (e.g. to retry a malformed response).
+    :param model_name: Model to use.
+    :param keep: The response is an artifact derived from document pages (e.g. a chunk summary): it is also kept
+                 in page_store, which does not expire, so it is reused when a revised version of the document
+                 arrives after the response cache's TTL (see revisions.py).
+    :return: Response text
+    """
+    with tracing.span("llm.generate", prompt_tokens=estimate_tokens(prompt)) as span:
+        text = None
+        if keep:
+            key = _cache_key(get_backend(), _model_id(model_name), prompt, generation_config)
+            text = None if refresh else page_store.get_artifact(key)
+            span.set(artifact_hit=text is not None)
+        if text is None:
+            text = _generate_text(span, prompt, generation_config, refresh, model_name)
+            if keep:
+                page_store.put_artifact(key, text)
+        return text
+
+
+def _generate_text(span, prompt, generation_config, refresh, model_name):
+    backend = get_backend()
+    span.set(backend=backend.name, model=model_name)
+    model_id = _model_id(model_name)
+    key = _cache_key(backend, model_id, prompt, generation_config)
+    if not refresh:
+        cached = llm_cache.get(key)
+        span.set(cache_hit=cached is not None)
+        if cached is not None:
+            return cached
+
+    with _lock:
+        future = _pending.get(key)
+        owner = future is None
+        if owner:
+            future = _pending[key] = Future()
+        else:
+            _stats["coalesced"] += 1
+    if not owner:
+        span.set(coalesced=True)
+        return future.result()
+
+    try:
+        text = _call_with_backoff(backend, model_id, prompt, generation_config, span)
+        _store_response(backend, key, model_id, prompt, generation_config, text)
+        future.set_result(text)
+        return text
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _lock:
+            del _pending[key]
+
+
+def _drain_stream(backend, key, model_id, prompt, generation_config, span, pieces):
+    """
+    Worker side of stream_text: runs the backend stream under the rate limits and the in-flight limit and hands
+    every piece to the consumer through the `pieces` queue, ending with _STREAM_END or the exception. The
+    in-flight slot is released as soon as the backend is done, however slowly the pieces are consumed (or if
+    they never are), and a complete response is cached either way.
+    """
+    try:
+        received = []
+        for attempt in range(MAX_RETRIES):
+            _acquire_rate_limits(prompt)
+            try:
+                with _in_flight:
+                    for piece in backend.stream(model_id, prompt, generation_config):
+                        if not received:
+                            span.set(first_piece_s=round(span.elapsed(), 4))
+                        received.append(piece)
+                        pieces.put(piece)
+                break
+            except backend.retryable_errors as e:
+                if received or attempt == MAX_RETRIES - 1:
+                    raise
+                _wait_before_retry(attempt, e, span)
+        _store_response(backend, key, model_id, prompt, generation_config, "".join(received))
+        pieces.put(_STREAM_END)
+    except BaseException as e:
+        pieces.put(e)
+
+
+def stream_text(prompt, generation_config=None, model_name=MODEL_NAME):
+    """
+    Like generate_text, but yields the response in pieces as the backend produces them.
+    A cached response is yielded in one piece; a stream that runs to completion is stored in the cache.
+    Failures before the first piece are retried like generate_text; a stream is never restarted midway.
+    The backend stream is read by a worker thread, so a slow or abandoned consumer never holds an in-flight slot.
+    :param prompt: The prompt text.
+    :param generation_config: Optional generation config passed through to the backend.
+    :param model_name: Model to use.
+    :return: Generator of text pieces
+    """
+    backend = get_backend()
+    model_id = _model_id(model_name)
+    key = _cache_key(backend, model_id, prompt, generation_config)
+    span = tracing.start_span("llm.stream", prompt_tokens=estimate_tokens(prompt), backend=backend.name,
+                              model=model_name)
+    error = None
+    try:
+        cached = llm_cache.get(key)
+        span.set(cache_hit=cached is not None)
+        if cached is not None:
+            yield cached
+            return
+
+        pieces = queue.Queue()
+        threading.Thread(target=_drain_stream, args=(backend, key, model_id, prompt, generation_config, span, pieces),
+                         name="llm-stream", daemon=True).start()
+        while True:
+            piece = pieces.get()
+            if piece is _STREAM_END:
+                break
+            if isinstance(piece, BaseException):
+                raise piece
+            yield piece
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        tracing.end_span(span, error)
+
+
+def stats():
+    """Returns request / retry / coalescing counters together with the response cache counters."""
+    with _lock:
+        counters = dict(_stats)
+    return dict(counters, backend=_backend.name if _backend else None, cache=llm_cache.stats())
@@ -0,0 +1,128 @@
+import difflib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+# Company -> ticker mappings and Yahoo Finance fundamentals, stored in SQLite
+CACHE_DIR = os.environ.get("FINSIGHT_CACHE_DIR", ".cache")
+MARKET_CACHE_PATH = os.path.join(CACHE_DIR, "market.sqlite")
+TICKER_MAX_AGE = float(os.environ.get("FINSIGHT_TICKER_MAX_AGE_DAYS", "365")) * 86400
+TICKER_MISS_MAX_AGE = 86400  # "No ticker found" answers are retried after a day
+FUNDAMENTALS_MAX_AGE = float(os.environ.get("FINSIGHT_FUNDAMENTALS_MAX_AGE_DAYS", "90")) * 86400
+FUZZY_CUTOFF = 0.9  # Minimum difflib similarity for a fuzzy company-name match
+
+_CORPORATE_SUFFIXES = {
+    "the", "inc", "incorporated", "corp", "corporation", "co", "company", "ltd", "limited",
+    "plc", "llc", "lp", "holdings", "holding", "group", "sa", "ag", "nv", "se", "com",
+}
+
+_lock = threading.Lock()
+_connection = None
+
+
+def _connect():
+    global _connection
+    if _connection is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        _connection = sqlite3.connect(MARKET_CACHE_PATH, timeout=30, check_same_thread=False)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.executescript(
+            "CREATE TABLE IF NOT EXISTS tickers ("
+            "  name_key TEXT PRIMARY KEY, name TEXT NOT NULL, ticker TEXT NOT NULL, updated REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS fundamentals ("
+            "  ticker TEXT NOT NULL, year INTEGER NOT NULL, metric TEXT NOT NULL, value REAL,"
+            "  fetched REAL NOT NULL, PRIMARY KEY (ticker, year, metric));"
+        )
+    return _connection
+
+
+def normalize_company_name(name):
+    """
+    Normalizes a company name for lookups: 'Amazon.com, Inc.' and 'amazon' both become 'amazon'.
+    A name made only of suffixes or punctuation ('The Company', 'Inc.') keeps its lower-cased form,
+    so such names never share one empty key.
+    """
+    words = re.sub(r"[^a-z0-9]+", " ", name.lower()).split()
+    return " ".join(word for word in words if word not in _CORPORATE_SUFFIXES) or name.strip().lower()
+
+
+### ---------------- TICKER INDEX ---------------- ###
+def lookup_ticker(company_name):
+    """
+    Looks up a cached ticker for a company name, falling back to a fuzzy match on the normalized name.
+    :return: The ticker, "" if the name is known to have no ticker, or None if the name is not cached
+    """
+    key = normalize_company_name(company_name)
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        row = conn.execute("SELECT ticker, updated FROM tickers WHERE name_key = ?", (key,)).fetchone()
+        if row is None:
+            keys = [k for (k,) in conn.execute("SELECT name_key FROM tickers WHERE ticker != ''")]
+            match = difflib.get_close_matches(key, keys, n=1, cutoff=FUZZY_CUTOFF)
+            if match:
+                row = conn.execute("SELECT ticker, updated FROM tickers WHERE name_key = ?", match).fetchone()
+    if row is None:
+        return None
+    ticker, updated = row
+    max_age = TICKER_MAX_AGE if ticker else TICKER_MISS_MAX_AGE
+    return ticker if now - updated <= max_age else None
+
+
+def store_ticker(company_name, ticker):
+    """Remembers the ticker for a company name (None records that no ticker was found)."""
+    with _lock:
+        conn = _connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO tickers (name_key, name, ticker, updated) VALUES (?, ?, ?, ?)",
+            (normalize_company_name(company_name), company_name, ticker or "", time.time()),
+        )
+        conn.commit()
+
+
+### ---------------- FUNDAMENTALS STORE ---------------- ###
+def load_fundamentals(ticker, years=3, max_age=FUNDAMENTALS_MAX_AGE):
+    """
+    Returns cached fundamentals for the latest `years` fiscal years of a ticker.
+    :param max_age: Maximum age in seconds; older data is treated as missing.
+    :return: Long-format DataFrame (Year | Metric | Value), or None if nothing fresh is cached
+    """
+    with _lock:
+        conn = _connect()
+        rows = conn.execute(
+            "SELECT year, metric, value, fetched FROM fundamentals WHERE ticker = ? "
+            "AND year IN (SELECT DISTINCT year FROM fundamentals WHERE ticker = ? ORDER BY year DESC LIMIT ?) "
+            "ORDER BY rowid",
+            (ticker, ticker, years),
+        ).fetchall()
+    if not rows or time.time() - min(row[3] for row in rows) > max_age:
+        return None
+    return pd.DataFrame([row[:3] for row in rows], columns=["Year", "Metric", "Value"])
+
+
+def store_fundamentals(ticker, df):
+    """Upserts long-format fundamentals (Year | Metric | Value) for a ticker."""
+    now = time.time()
+    records = [
+        (ticker, int(year), metric, None if pd.isna(value) else float(value), now)
+        for year, metric, value in df[["Year", "Metric", "Value"]].itertuples(index=False)
+    ]
+    with _lock:
+        conn = _connect()
+        conn.executemany(
+            "INSERT OR REPLACE INTO fundamentals (ticker, year, metric, value, fetched) VALUES (?, ?, ?, ?, ?)",
+            records,
+        )
+        conn.commit()
+
+
+def clear():
+    """Removes every cached ticker and fundamental."""
+    with _lock:
+        conn = _connect()
+        conn.executescript("DELETE FROM tickers; DELETE FROM fundamentals;")
+        conn.commit()
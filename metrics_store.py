@@ -0,0 +1,155 @@
+import os
+import shutil
+import threading
+import time
+from urllib.parse import quote, unquote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Persistent columnar store of long-format financials (Company | Year | Metric | Value | Source).
+# Parquet files are hive-partitioned as Company=<name>/Year=<year>/part.parquet, so queries for a
+# peer group or a year range only open the matching partitions; Metric and Source are dictionary-encoded.
+CACHE_DIR = os.environ.get("FINSIGHT_CACHE_DIR", ".cache")
+STORE_DIR = os.environ.get("FINSIGHT_METRICS_STORE", os.path.join(CACHE_DIR, "metrics"))
+PART_FILE = "part.parquet"
+KEY_COLUMNS = ["Company", "Year", "Metric", "Source"]
+
+FILE_SCHEMA = pa.schema([
+    ("Metric", pa.dictionary(pa.int32(), pa.string())),
+    ("Value", pa.float64()),
+    ("Source", pa.dictionary(pa.int8(), pa.string())),
+    ("Updated", pa.timestamp("s")),
+])
+# Partition values are read back dictionary-encoded (Year is converted to int after the scan)
+PARTITIONING = ds.HivePartitioning.discover(infer_dictionary=True)
+
+_lock = threading.Lock()
+
+
+def _partition_dir(company, year):
+    # Partition values are URI-encoded, which pyarrow decodes again when reading
+    return os.path.join(STORE_DIR, f"Company={quote(company, safe='')}", f"Year={int(year)}")
+
+
+def _normalize(df, company=None, source="report"):
+    """Coerces a long-format frame to the store's columns, dropping rows without a year or value."""
+    df = df.copy()
+    if company is not None:
+        df["Company"] = company
+    if "Source" not in df.columns:
+        df["Source"] = source
+    df["Year"] = pd.to_numeric(df["Year"], errors="coerce")
+    df["Value"] = pd.to_numeric(df["Value"], errors="coerce")
+    df = df.dropna(subset=["Company", "Year", "Value"])
+    df["Year"] = df["Year"].astype(int)
+    df["Metric"] = df["Metric"].astype(str)
+    df["Source"] = df["Source"].astype(str)
+    return df[KEY_COLUMNS + ["Value"]].drop_duplicates(subset=KEY_COLUMNS, keep="last")
+
+
+def _write_partition(path, df):
+    table = pa.Table.from_pandas(df[["Metric", "Value", "Source", "Updated"]], schema=FILE_SCHEMA, preserve_index=False)
+    os.makedirs(path, exist_ok=True)
+    # Dot-prefixed, so dataset discovery never picks up a half-written file
+    tmp_path = os.path.join(path, f".{PART_FILE}.{threading.get_ident()}.tmp")
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, os.path.join(path, PART_FILE))
+
+
+def upsert(df, company=None, source="report"):
+    """
+    Inserts or replaces rows keyed by (Company, Year, Metric, Source).
+    Only the (Company, Year) partitions touched by `df` are rewritten.
+    :param df: Long-format DataFrame with Year, Metric and Value columns (and Company unless `company` is given).
+    :param company: Company name for every row.
+    :param source: Origin of the numbers, e.g. "report" (extracted from a PDF) or "yahoo".
+    :return: Number of rows written
+    """
+    if df is None or df.empty:
+        return 0
+    rows = _normalize(df, company, source)
+    rows["Updated"] = pd.Timestamp(int(time.time()), unit="s")
+
+    with _lock:
+        for (name, year), new in rows.groupby(["Company", "Year"], sort=False):
+            path = _partition_dir(name, year)
+            part_path = os.path.join(path, PART_FILE)
+            if os.path.exists(part_path):
+                old = pq.read_table(part_path).to_pandas()
+                old[["Metric", "Source"]] = old[["Metric", "Source"]].astype(str)
+                replaced = old.set_index(["Metric", "Source"]).index.isin(new.set_index(["Metric", "Source"]).index)
+                new = pd.concat([old[~replaced], new[old.columns]], ignore_index=True)
+            _write_partition(path, new)
+    return len(rows)
+
+
+def query(metrics=None, companies=None, years=None, last_n_years=None, sources=None):
+    """
+    Reads rows matching all given predicates. Company and Year filters prune whole partitions,
+    the remaining filters are pushed down to the Parquet scan.
+    :param metrics: Metric names to include (all if None).
+    :param companies: Company names to include (all if None).
+    :param years: Fiscal years to include (all if None).
+    :param last_n_years: Keep only each company's latest N years in the result.
+    :param sources: Sources to include, e.g. ["report"] (all if None).
+    :return: Long-format DataFrame (Company | Year | Metric | Value | Source | Updated)
+    """
+    columns = ["Company", "Year", "Metric", "Value", "Source", "Updated"]
+    if not os.path.isdir(STORE_DIR):
+        return pd.DataFrame(columns=columns)
+
+    dataset = ds.dataset(STORE_DIR, format="parquet", partitioning=PARTITIONING)
+    predicate = None
+    for column, values in (("Company", companies), ("Year", years), ("Metric", metrics), ("Source", sources)):
+        if values is not None:
+            condition = ds.field(column).isin(list(values))
+            predicate = condition if predicate is None else predicate & condition
+
+    df = dataset.to_table(columns=columns, filter=predicate).to_pandas()
+    for column in ("Company", "Metric", "Source"):
+        df[column] = df[column].astype(str)
+    df["Year"] = df["Year"].astype(int)
+    if last_n_years and not df.empty:
+        latest = df.groupby("Company")["Year"].transform("max")
+        df = df[df["Year"] > latest - last_n_years]
+    return df.sort_values(["Company", "Metric", "Year"], ascending=[True, True, False]).reset_index(drop=True)
+
+
+def metric_across_peers(metric, companies, years=3, source=None):
+    """
+    One metric for a peer group over the latest `years` years as a Company x Year table.
+    When a company has the metric from several sources, reported figures win over fetched ones.
+    """
+    df = query(metrics=[metric], companies=companies, last_n_years=years,
+               sources=[source] if source else None)
+    if df.empty:
+        return pd.DataFrame(index=pd.Index(companies, name="Company"))
+    df = df.sort_values("Source", key=lambda s: s.ne("report")).drop_duplicates(["Company", "Year"])
+    return df.pivot(index="Company", columns="Year", values="Value").reindex(companies)
+
+
+def companies():
+    """Names of all companies in the store."""
+    if not os.path.isdir(STORE_DIR):
+        return []
+    return sorted(unquote(name.split("=", 1)[1]) for name in os.listdir(STORE_DIR) if name.startswith("Company="))
+
+
+def delete(company, years=None):
+    """Removes a company's partitions (only the given years if `years` is set)."""
+    with _lock:
+        company_dir = os.path.dirname(_partition_dir(company, 0))
+        if years is None:
+            shutil.rmtree(company_dir, ignore_errors=True)
+        else:
+            for year in years:
+                shutil.rmtree(_partition_dir(company, year), ignore_errors=True)
+
+
+def clear():
+    """Deletes the whole store."""
+    with _lock:
+        shutil.rmtree(STORE_DIR, ignore_errors=True)
@@ -0,0 +1,183 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Extracted page texts stored in SQLite by page fingerprint (see pdf_extract.page_fingerprints), so a revised
+# filing only has its changed pages parsed, plus the page list of every document seen, so a new version can
+# be matched with the version it replaces, and the artifacts derived from the pages (chunk summaries, sentiment
+# counts; keyed by their LLM request), which unlike llm_cache entries do not expire: the unchanged artifacts of a
+# filing revised a quarter or a year later are reused. Pages and artifacts share MAX_STORE_BYTES.
+CACHE_DIR = os.environ.get("FINSIGHT_CACHE_DIR", ".cache")
+PAGE_STORE_PATH = os.path.join(CACHE_DIR, "pages.sqlite")
+MAX_STORE_BYTES = int(os.environ.get("FINSIGHT_PAGE_STORE_MB", "256")) * 1024 * 1024
+MIN_SHARED_PAGES = 0.2  # Share of its pages a stored document must have in common to count as a previous version
+READ_BATCH_PAGES = 16   # Pages fetched per query when streaming a document's pages
+
+_lock = threading.Lock()
+_connection = None
+
+
+def _connect():
+    global _connection
+    if _connection is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        _connection = sqlite3.connect(PAGE_STORE_PATH, timeout=30, check_same_thread=False)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "fingerprint TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        _connection.execute("CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used)")
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "key TEXT PRIMARY KEY, fingerprints TEXT NOT NULL, created REAL NOT NULL)"
+        )
+    return _connection
+
+
+def known(fingerprints):
+    """Returns the subset of the given page fingerprints whose text is stored."""
+    wanted = sorted({fp for fp in fingerprints if fp})
+    found = set()
+    with _lock:
+        conn = _connect()
+        for i in range(0, len(wanted), 500):  # Stay below SQLite's bound-parameter limit
+            batch = wanted[i:i + 500]
+            rows = conn.execute(f"SELECT fingerprint FROM pages WHERE fingerprint IN ({','.join('?' * len(batch))})",
+                                batch)
+            found.update(row[0] for row in rows)
+    return found
+
+
+def get(fingerprint):
+    """Returns the stored text of a page, or None."""
+    with _lock:
+        conn = _connect()
+        row = conn.execute("SELECT text FROM pages WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE pages SET last_used = ? WHERE fingerprint = ?", (time.time(), fingerprint))
+        conn.commit()
+        return row[0]
+
+
+def iter_texts(fingerprints):
+    """
+    Yields the stored text of each page in order (None for pages not stored), READ_BATCH_PAGES at a time,
+    so a document can be streamed without holding all of its pages.
+    """
+    for i in range(0, len(fingerprints), READ_BATCH_PAGES):
+        batch = fingerprints[i:i + READ_BATCH_PAGES]
+        wanted = sorted({fp for fp in batch if fp})
+        with _lock:
+            conn = _connect()
+            texts = dict(conn.execute(f"SELECT fingerprint, text FROM pages WHERE fingerprint IN "
+                                      f"({','.join('?' * len(wanted))})", wanted).fetchall())
+            conn.execute(f"UPDATE pages SET last_used = ? WHERE fingerprint IN ({','.join('?' * len(wanted))})",
+                         [time.time(), *wanted])
+            conn.commit()
+        for fp in batch:
+            yield texts.get(fp)
+
+
+def put_many(texts):
+    """Stores page texts (dict of fingerprint -> text) and evicts the least recently used beyond MAX_STORE_BYTES."""
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        conn.executemany(
+            "INSERT OR REPLACE INTO pages (fingerprint, text, size, last_used) VALUES (?, ?, ?, ?)",
+            [(fp, text, len(text.encode("utf-8")), now) for fp, text in texts.items() if fp],
+        )
+        _evict(conn)
+        conn.commit()
+
+
+def get_artifact(key):
+    """Returns a stored artifact, or None."""
+    with _lock:
+        conn = _connect()
+        row = conn.execute("SELECT value FROM artifacts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE artifacts SET last_used = ? WHERE key = ?", (time.time(), key))
+        conn.commit()
+        return row[0]
+
+
+def put_artifact(key, value):
+    """Stores an artifact and evicts the least recently used pages and artifacts beyond MAX_STORE_BYTES."""
+    with _lock:
+        conn = _connect()
+        conn.execute("INSERT OR REPLACE INTO artifacts (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                     (key, value, len(value.encode("utf-8")), time.time()))
+        _evict(conn)
+        conn.commit()
+
+
+def _evict(conn):
+    total = conn.execute("SELECT (SELECT COALESCE(SUM(size), 0) FROM pages) + "
+                         "(SELECT COALESCE(SUM(size), 0) FROM artifacts)").fetchone()[0]
+    if total <= MAX_STORE_BYTES:
+        return
+    rows = conn.execute("SELECT 'pages', fingerprint, size, last_used FROM pages UNION ALL "
+                        "SELECT 'artifacts', key, size, last_used FROM artifacts ORDER BY last_used").fetchall()
+    for table, key, size, _ in rows:
+        column = "fingerprint" if table == "pages" else "key"
+        conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (key,))
+        total -= size
+        if total <= MAX_STORE_BYTES:
+            break
+
+
+def record_document(key, fingerprints):
+    """Remembers the page fingerprints of a document version."""
+    with _lock:
+        conn = _connect()
+        conn.execute("INSERT OR REPLACE INTO documents (key, fingerprints, created) VALUES (?, ?, ?)",
+                     (key, json.dumps(fingerprints), time.time()))
+        conn.commit()
+
+
+def document_fingerprints(key):
+    """The page fingerprints recorded for a document, or None."""
+    with _lock:
+        row = _connect().execute("SELECT fingerprints FROM documents WHERE key = ?", (key,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def previous_version(key, fingerprints):
+    """
+    Finds the recorded document sharing the most pages with a new one (other than the document itself),
+    i.e. the version an amended or updated filing replaces.
+    :return: (key, fingerprints) of that document, or None if none shares at least MIN_SHARED_PAGES of its pages
+    """
+    pages = {fp for fp in fingerprints if fp}
+    best, best_shared = None, 0
+    with _lock:
+        rows = _connect().execute("SELECT key, fingerprints FROM documents WHERE key != ? ORDER BY created DESC",
+                                  (key,)).fetchall()
+    for other_key, other in rows:
+        other = json.loads(other)
+        shared = len(pages.intersection(other))
+        if shared > best_shared:
+            best, best_shared = (other_key, other), shared
+    if best is None or best_shared < MIN_SHARED_PAGES * max(len(pages), 1):
+        return None
+    return best
+
+
+def clear():
+    """Removes every stored page, artifact and document."""
+    with _lock:
+        conn = _connect()
+        conn.execute("DELETE FROM pages")
+        conn.execute("DELETE FROM artifacts")
+        conn.execute("DELETE FROM documents")
+        conn.commit()
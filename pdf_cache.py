@@ -0,0 +1,96 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+# Extracted pages are stored as gzipped JSON files named after the SHA-256 of the PDF bytes
+CACHE_DIR = os.environ.get("FINSIGHT_CACHE_DIR", ".cache")
+PDF_CACHE_DIR = os.path.join(CACHE_DIR, "pdf")
+MAX_CACHE_BYTES = int(os.environ.get("FINSIGHT_PDF_CACHE_MB", "512")) * 1024 * 1024
+
+_lock = threading.Lock()
+
+
+def document_key(pdf_bytes, extractor_version):
+    """Content address of a PDF: hash of the extractor version and the raw PDF bytes."""
+    digest = hashlib.sha256(f"v{extractor_version}:".encode())
+    digest.update(pdf_bytes)
+    return digest.hexdigest()
+
+
+def file_key(path, extractor_version, block_size=1 << 20):
+    """document_key() of a PDF file, hashed in blocks instead of reading the whole file into memory."""
+    digest = hashlib.sha256(f"v{extractor_version}:".encode())
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(PDF_CACHE_DIR, f"{key}.json.gz")
+
+
+def load(key):
+    """
+    Returns the cached entry for a document, or None on a miss.
+    An entry is a dict with "pages" (one text per page) and "tables" (page index -> list of tables).
+    """
+    path = _entry_path(key)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            entry = json.load(f)
+        os.utime(path)  # Mark as recently used for LRU eviction
+        return entry
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Discarding unreadable PDF cache entry {key}: {e}")
+        _remove(path)
+        return None
+
+
+def store(key, entry):
+    """Writes a document entry atomically and evicts old entries beyond MAX_CACHE_BYTES."""
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    path = _entry_path(key)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(entry, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Error writing PDF cache entry {key}: {e}")
+        _remove(tmp_path)
+        return
+    evict(MAX_CACHE_BYTES)
+
+
+def evict(max_bytes=MAX_CACHE_BYTES):
+    """Deletes least recently used entries until the cache fits in max_bytes."""
+    with _lock:
+        try:
+            with os.scandir(PDF_CACHE_DIR) as it:
+                entries = [(e.stat().st_mtime, e.stat().st_size, e.path)
+                           for e in it if e.name.endswith(".json.gz")]
+        except FileNotFoundError:
+            return
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            _remove(path)
+            total -= size
+
+
+def clear():
+    """Removes every cached document."""
+    evict(0)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
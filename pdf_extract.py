@@ -0,0 +1,151 @@
+import hashlib
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from itertools import islice
+
+import pdfplumber
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdftypes import PDFStream, resolve1
+
+# Page-text extraction with pdfplumber, sharded across worker processes for large documents.
+# Kept free of the analysis stack (pandas, Gemini, Yahoo) so worker processes start fast and small.
+# Pages are streamed shard by shard: each shard opens the PDF with only its own pages loaded, so the parsed
+# layout of a 500-page filing is never held at once and memory stays flat regardless of page count.
+PAGES_PER_SHARD = 16      # Pages handed to one worker process (or parsed serially) at a time
+PARALLEL_MIN_PAGES = 32   # Smaller documents are not worth the process start-up cost
+SHARDS_IN_FLIGHT = 2      # Shards queued per worker process; bounds the parsed text waiting to be consumed
+MAX_FORM_DEPTH = 4        # Nesting of form XObjects followed when fingerprinting a page
+
+
+def read_pdf_bytes(pdf_file):
+    """Returns the raw bytes of an uploaded / file-like PDF."""
+    if hasattr(pdf_file, "getvalue"):
+        return pdf_file.getvalue()
+    pdf_file.seek(0)
+    return pdf_file.read()
+
+
+def open_pdf(source, pages=None):
+    """Opens a PDF from a path or from raw bytes; `pages` (1-based page numbers) limits the pages loaded."""
+    return pdfplumber.open(BytesIO(source) if isinstance(source, bytes) else source, pages=pages)
+
+
+def count_pages(source):
+    """Number of pages of a PDF."""
+    with open_pdf(source) as pdf:
+        return len(pdf.pages)
+
+
+def extract_page_text(page):
+    """Extracts the text of a single page; unreadable or empty pages yield an empty string."""
+    try:
+        return page.extract_text() or ""
+    except Exception as e:
+        print(f"Error extracting text from page {page.page_number}: {e}")
+        return ""
+    finally:
+        page.close()  # Release the page's cached layout objects
+
+
+def extract_pages(source, indices):
+    """Extracts the text of the given zero-based pages of a PDF, in order. Runs inside worker processes."""
+    indices = list(indices)
+    with open_pdf(source, pages=[i + 1 for i in indices]) as pdf:
+        texts = {page.page_number - 1: extract_page_text(page) for page in pdf.pages}
+    return [texts.get(i, "") for i in indices]
+
+
+def extract_page_range(source, start, stop):
+    """Extracts the text of pages [start, stop) of a PDF."""
+    return extract_pages(source, range(start, stop))
+
+
+def _digest_resources(resources, digest, depth=0):
+    """Adds the fonts (and their text encodings) and form XObjects a page draws with to its fingerprint."""
+    resources = resolve1(resources) or {}
+    for name, font in sorted((resolve1(resources.get("Font")) or {}).items()):
+        font = resolve1(font) or {}
+        digest.update(f"font {name} {resolve1(font.get('BaseFont'))}".encode())
+        to_unicode = resolve1(font.get("ToUnicode"))
+        if isinstance(to_unicode, PDFStream):
+            digest.update(to_unicode.get_data())
+    for name, xobject in sorted((resolve1(resources.get("XObject")) or {}).items()):
+        xobject = resolve1(xobject)
+        subtype = getattr(resolve1(xobject.get("Subtype")), "name", None) if isinstance(xobject, PDFStream) else None
+        if subtype == "Form" and depth < MAX_FORM_DEPTH:  # Forms can hold text; images are left out
+            digest.update(f"form {name}".encode())
+            digest.update(xobject.get_data())
+            _digest_resources(xobject.get("Resources"), digest, depth + 1)
+
+
+def page_fingerprints(source):
+    """
+    Content hash of every page of a PDF, computed from the raw page content streams and fonts without any
+    layout analysis (a fraction of a second for hundreds of pages). Pages whose fingerprint is unchanged
+    between two versions of a document extract to the same text. Unreadable pages get None.
+    """
+    fingerprints = []
+    with open_pdf(source) as pdf:
+        for page in PDFPage.create_pages(pdf.doc):
+            try:
+                digest = hashlib.sha256(repr(page.mediabox).encode())
+                for stream in page.contents:
+                    digest.update(resolve1(stream).get_data())
+                _digest_resources(page.resources, digest)
+                fingerprints.append(digest.hexdigest())
+            except Exception as e:
+                print(f"Error fingerprinting page {len(fingerprints) + 1}: {e}")
+                fingerprints.append(None)
+    return fingerprints
+
+
+def _shards(indices):
+    return [indices[i:i + PAGES_PER_SHARD] for i in range(0, len(indices), PAGES_PER_SHARD)]
+
+
+def _iter_serial(source, shards):
+    for shard in shards:
+        yield from extract_pages(source, shard)
+
+
+def _iter_parallel(source, shards, workers):
+    """Yields page texts in order, with at most workers * SHARDS_IN_FLIGHT shards queued or waiting."""
+    shards = deque(shards)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        running = deque()
+        while shards or running:
+            while shards and len(running) < workers * SHARDS_IN_FLIGHT:
+                running.append(pool.submit(extract_pages, source, shards.popleft()))
+            yield from running.popleft().result()
+
+
+def iter_pages(source, workers, indices=None):
+    """
+    Yields the text of every page of a PDF (or of the zero-based `indices` only) in page order,
+    parsing one shard of pages at a time. Large documents are sharded across a process pool; pass a file
+    path rather than bytes so that workers re-open the file instead of receiving a copy with every shard.
+    """
+    indices = list(range(count_pages(source)) if indices is None else indices)
+    shards = _shards(indices)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(indices) < PARALLEL_MIN_PAGES:
+        yield from _iter_serial(source, shards)
+        return
+
+    done = 0
+    try:
+        for text in _iter_parallel(source, shards, workers):
+            yield text
+            done += 1
+    except BrokenProcessPool as e:
+        print(f"Parallel PDF extraction failed, falling back to serial: {e}")
+        remaining = _iter_serial(source, shards[done // PAGES_PER_SHARD:])
+        yield from islice(remaining, done % PAGES_PER_SHARD, None)
+
+
+def parse_pages(source, workers):
+    """Extracts all page texts of a PDF, sharding large documents across a process pool."""
+    return list(iter_pages(source, workers))
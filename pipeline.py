@@ -0,0 +1,66 @@
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import tracing
+
+
+class Pipeline:
+    """
+    Small DAG executor for the report-analysis stages.
+    Every stage runs on a thread pool as soon as the stages it depends on have finished,
+    so independent LLM calls overlap and the total latency is that of the longest chain.
+
+    Example:
+        pipeline = Pipeline()
+        pipeline.add("metrics", extract_key_metrics_llm, report_text)
+        pipeline.add("summary", summarize_text, report_text)
+        pipeline.add("metrics_summary", summarize_financial_metrics, deps=["metrics"])
+        results = pipeline.run()
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._stages = {}
+
+    def add(self, name, func, *args, deps=(), **kwargs):
+        """
+        Registers a stage.
+        :param name: Unique stage name; its result is stored under this key.
+        :param func: Callable to run.
+        :param args: Extra positional arguments, passed after the dependency results.
+        :param deps: Names of earlier stages whose results are passed to func first, in order.
+        :param kwargs: Keyword arguments for func.
+        :return: The pipeline, so calls can be chained
+        """
+        if name in self._stages:
+            raise ValueError(f"Stage '{name}' is already defined")
+        unknown = [dep for dep in deps if dep not in self._stages]
+        if unknown:
+            raise ValueError(f"Stage '{name}' depends on undefined stage(s): {', '.join(unknown)}")
+        self._stages[name] = (func, tuple(deps), args, kwargs)
+        return self
+
+    def run(self, on_stage_done=None):
+        """
+        Runs every stage and returns a dict of stage name -> result. The first failing stage's error is raised.
+        :param on_stage_done: Optional callback(name, finished_count, total_count) called as each stage finishes.
+        """
+        results = {}
+        pending = dict(self._stages)
+        running = {}
+
+        with tracing.ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                for name, (func, deps, args, kwargs) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        dep_results = [results[dep] for dep in deps]
+                        running[pool.submit(func, *dep_results, *args, **kwargs)] = name
+                        del pending[name]
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    results[name] = future.result()
+                    if on_stage_done is not None:
+                        on_stage_done(name, len(results), len(self._stages))
+
+        return results
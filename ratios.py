@@ -0,0 +1,157 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import tracing
+
+# Peer-group KPIs computed in one pass over the long-format metrics frame (Company | Year | Metric | Value):
+# a single pivot to a (Company, Year) x Metric matrix, then NumPy arithmetic for all companies and years at once.
+# Summaries are prompted with these ratios instead of the raw tables, so the LLM does not do the arithmetic.
+RATIOS = {
+    # Ratio -> (numerator metric, denominator metric)
+    "EBITDA Margin": ("EBITDA", "Revenue"),
+    "Net Margin": ("Net Profit", "Revenue"),
+    "Leverage": ("Total Liabilities", "Equity"),           # Liabilities per unit of equity
+    "Liabilities to Assets": ("Total Liabilities", "Total Assets"),
+    "ROE": ("Net Profit", "Equity"),
+    "ROA": ("Net Profit", "Total Assets"),
+    "Cash Conversion": ("Operating Cash Flow", "Net Profit"),  # Operating cash flow per unit of net profit
+}
+GROWTH_METRICS = ["Revenue", "Net Profit", "EBITDA"]       # Year-over-year growth and CAGR are computed for these
+LOWER_IS_BETTER = {"Leverage", "Liabilities to Assets"}     # Ranked in reverse, so 100 is always the best
+MULTIPLES = {"Leverage", "Cash Conversion"}                 # Shown as multiples (1.5x); all other ratios as %
+RATIO_COLUMNS = [*RATIOS, *(f"{metric} YoY" for metric in GROWTH_METRICS),
+                 *(f"{metric} CAGR" for metric in GROWTH_METRICS)]
+MAX_CACHED_GROUPS = 128
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _safe_divide(numerator, denominator):
+    """Element-wise division; NaN where the denominator is zero or missing."""
+    numerator, denominator = np.asarray(numerator, dtype=float), np.asarray(denominator, dtype=float)
+    out = np.full(np.broadcast(numerator, denominator).shape, np.nan)
+    return np.divide(numerator, denominator, out=out, where=(denominator != 0) & ~np.isnan(denominator))
+
+
+def _pivot(metrics):
+    """(Company, Year) x Metric matrix of the key metrics, years ascending within each company."""
+    needed = {metric for pair in RATIOS.values() for metric in pair} | set(GROWTH_METRICS)
+    df = metrics[metrics["Metric"].isin(needed)].dropna(subset=["Value"])
+    df = df.assign(Year=df["Year"].astype(int), Value=pd.to_numeric(df["Value"], errors="coerce"))
+    wide = df.pivot_table(index=["Company", "Year"], columns="Metric", values="Value", aggfunc="first")
+    return wide.reindex(columns=sorted(needed)).sort_index()
+
+
+def compute_ratios(metrics):
+    """
+    Computes margins, leverage, returns, cash conversion, year-over-year growth and CAGR for every company and year.
+    :param metrics: Long-format DataFrame with columns Company, Year, Metric, Value (e.g. from compare_metrics).
+    :return: DataFrame indexed by (Company, Year), one column per ratio. Ratios and growth rates are fractions
+             (0.12 = 12%); growth and CAGR are NaN where the previous year or a positive base value is missing.
+             CAGR is the compound growth from each company's first year to that row's year.
+             Empty (with the same columns) if no company has a usable key metric.
+    """
+    wide = _pivot(metrics)
+    if wide.empty:
+        index = pd.MultiIndex.from_arrays([[], []], names=["Company", "Year"])
+        return pd.DataFrame(columns=[*RATIO_COLUMNS, "Revenue"], index=index, dtype=float)
+    values = wide.to_numpy()
+    column = {metric: i for i, metric in enumerate(wide.columns)}
+    companies = wide.index.get_level_values("Company").to_numpy()
+    years = wide.index.get_level_values("Year").to_numpy()
+
+    out = {name: _safe_divide(values[:, column[num]], values[:, column[den]]) for name, (num, den) in RATIOS.items()}
+
+    # Previous row is the same company's previous fiscal year (rows are sorted by company, then year)
+    previous = np.roll(values, 1, axis=0)
+    consecutive = (companies == np.roll(companies, 1)) & (years == np.roll(years, 1) + 1)
+    consecutive[0] = False
+
+    # First year of each company, broadcast to all of its rows, for CAGR
+    first_row = np.r_[True, companies[1:] != companies[:-1]]
+    first_index = np.maximum.accumulate(np.where(first_row, np.arange(len(companies)), 0))
+    span = years - years[first_index]
+
+    for metric in GROWTH_METRICS:
+        current, base = values[:, column[metric]], previous[:, column[metric]]
+        yoy = _safe_divide(current - base, np.abs(base))
+        out[f"{metric} YoY"] = np.where(consecutive, yoy, np.nan)
+
+        first = values[first_index, column[metric]]
+        valid = (span > 0) & (first > 0) & (current > 0)
+        ratio = _safe_divide(current, np.where(valid, first, np.nan))
+        out[f"{metric} CAGR"] = np.where(valid, np.power(ratio, 1 / np.maximum(span, 1)) - 1, np.nan)
+
+    ratios = pd.DataFrame(out, index=wide.index)
+    ratios["Revenue"] = values[:, column["Revenue"]]
+    return ratios
+
+
+def percentile_ranks(ratios):
+    """
+    Percentile rank (0-100) of each company's latest year within the peer group, per ratio.
+    Ratios where lower is better (leverage) are ranked in reverse, so 100 is always the strongest company.
+    :param ratios: Output of compute_ratios.
+    :return: DataFrame indexed by Company, one column per ratio
+    """
+    latest = ratios.groupby(level="Company").tail(1).droplevel("Year")[RATIO_COLUMNS].round(6)  # Ties rank equal
+    ranks = latest.rank(pct=True, method="average")
+    lower = [name for name in RATIO_COLUMNS if name in LOWER_IS_BETTER]
+    ranks[lower] = latest[lower].rank(pct=True, method="average", ascending=False)
+    return ranks.mul(100).round(0)
+
+
+def _group_key(metrics):
+    """Peer group plus a hash of its figures: cached ratios are reused until any input value changes."""
+    columns = metrics[["Company", "Year", "Metric", "Value"]]
+    digest = hashlib.sha256(pd.util.hash_pandas_object(columns, index=False).to_numpy().tobytes()).hexdigest()
+    return tuple(sorted(columns["Company"].unique())), digest
+
+
+def peer_group_ratios(metrics):
+    """
+    Ratios and percentile ranks for a peer group (see compute_ratios and percentile_ranks), cached per
+    peer group and input data.
+    :return: (ratios, ranks) DataFrames; treat them as read-only, they are shared between callers
+    """
+    key = _group_key(metrics)
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    with tracing.span("transform.peer_ratios", companies=len(key[0])):
+        ratios = compute_ratios(metrics)
+        result = (ratios, percentile_ranks(ratios))
+    with _lock:
+        _cache[key] = result
+        while len(_cache) > MAX_CACHED_GROUPS:
+            _cache.popitem(last=False)
+    return result
+
+
+def latest_ratios(ratios):
+    """
+    Each company's latest fiscal year, formatted for display and prompts: percentages ("Net Margin %"),
+    multiples ("Leverage x") and revenue in billions. Ratios no company has are left out.
+    """
+    latest = ratios.groupby(level="Company").tail(1).reset_index(level="Year")
+    table = pd.DataFrame({
+        f"{name} x" if name in MULTIPLES else f"{name} %":
+            latest[name].round(2) if name in MULTIPLES else latest[name].mul(100).round(1)
+        for name in RATIO_COLUMNS
+    })
+    table.insert(0, "Revenue (bn)", (latest["Revenue"] / 1e9).round(2))
+    table.insert(0, "Year", latest["Year"])
+    return table.dropna(axis=1, how="all")
+
+
+def clear():
+    """Drops every cached peer group."""
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,117 @@
+import difflib
+
+import page_store
+import section_index
+import sentiment_analyzer
+import summarizer
+
+# Incremental re-analysis of amended or updated filings.
+# Every derived artifact (summary chunk, statement metrics, sentiment chunk) is recorded with the pages it is
+# computed from. When a new version of a document arrives, its page fingerprints are aligned with those of the
+# version it replaces; only the changed pages are parsed again (PdfDocument reads the others from page_store)
+# and only the artifacts that depend on a changed page are recomputed. The artifacts are content-addressed by
+# their LLM request and kept in page_store without expiry (llm_client.generate_text(..., keep=True)), so the
+# stages skip every artifact that is not stale however long ago the previous version was analysed.
+
+KINDS = ("summary", "metrics", "sentiment")
+
+
+def diff_pages(old_fingerprints, new_fingerprints):
+    """
+    Pages of a new version whose content or surroundings differ from the old one: inserted and replaced pages,
+    plus the pages on either side of a deletion (artifacts spanning those pages lost the deleted text).
+    The two page sequences are aligned, so inserting or removing a page does not mark every page after it.
+    :return: Sorted zero-based indices into new_fingerprints
+    """
+    matcher = difflib.SequenceMatcher(None, old_fingerprints, new_fingerprints, autojunk=False)
+    changed = set()
+    for tag, _, _, j1, j2 in matcher.get_opcodes():
+        if tag in ("replace", "insert"):
+            changed.update(range(j1, j2))
+        elif tag == "delete":
+            changed.update(page for page in (j1 - 1, j1) if 0 <= page < len(new_fingerprints))
+    changed.update(i for i, fp in enumerate(new_fingerprints) if fp is None)  # Unreadable pages never match
+    return sorted(changed)
+
+
+class DependencyGraph:
+    """
+    Edges from pages to the artifacts derived from them.
+
+    Example:
+        graph = DependencyGraph()
+        graph.add("summary_chunk:0", [0, 1, 2])
+        graph.add("metrics:balance_sheet", [51])
+        graph.affected([2])  # -> ["summary_chunk:0"]
+    """
+
+    def __init__(self):
+        self._pages = {}
+
+    def add(self, artifact, pages):
+        """Registers an artifact computed from the given page indices. Returns the graph, so calls can be chained."""
+        self._pages[artifact] = frozenset(pages)
+        return self
+
+    def __len__(self):
+        return len(self._pages)
+
+    def artifacts(self):
+        return list(self._pages)
+
+    def pages_of(self, artifact):
+        return sorted(self._pages[artifact])
+
+    def affected(self, changed_pages):
+        """Artifacts that depend on at least one of the changed pages, in registration order."""
+        changed = set(changed_pages)
+        return [artifact for artifact, pages in self._pages.items() if pages & changed]
+
+
+def build_graph(document, kinds=KINDS):
+    """
+    Builds the dependency graph of a document's artifacts.
+    :param document: A PdfDocument.
+    :param kinds: Which artifact families to include: "summary" (chunk summaries and the final summary),
+                  "metrics" (metric rows read from each located statement) and "sentiment" (sentiment chunks).
+    """
+    graph = DependencyGraph()
+    if "summary" in kinds:
+        chunks = summarizer.chunk_pages(document)
+        for i, pages in enumerate(chunks):
+            graph.add(f"summary_chunk:{i}", pages)
+        graph.add("summary", {page for pages in chunks for page in pages})
+    if "metrics" in kinds:
+        for section, pages in section_index.document_index(document).items():
+            if pages:
+                graph.add(f"metrics:{section}", pages)
+    if "sentiment" in kinds:
+        for i, pages in enumerate(sentiment_analyzer.sentiment_chunk_pages(document)):
+            graph.add(f"sentiment_chunk:{i}", pages)
+    return graph
+
+
+def plan_revision(document, kinds=KINDS):
+    """
+    Compares a document with the previously analysed version it shares the most pages with.
+    The document is then recorded, so that its own next version is compared with it.
+    :return: Dict with "previous" (key of that version, or None for a new document), "pages", "changed_pages",
+             "artifacts" (number of artifacts) and "stale" (artifacts downstream of a changed page, which will
+             be recomputed; everything else is reused)
+    """
+    fingerprints = document.fingerprints()
+    recorded = page_store.document_fingerprints(document.key)
+    if recorded is not None:
+        previous = (document.key, recorded)  # This very version was analysed before
+    else:
+        previous = page_store.previous_version(document.key, fingerprints)
+    changed = diff_pages(previous[1], fingerprints) if previous else list(range(len(fingerprints)))
+    graph = build_graph(document, kinds)
+    page_store.record_document(document.key, fingerprints)
+    return {
+        "previous": previous[0] if previous else None,
+        "pages": len(fingerprints),
+        "changed_pages": changed,
+        "artifacts": len(graph),
+        "stale": graph.affected(changed),
+    }
@@ -0,0 +1,327 @@
+"""
+Local search over processed reports and transcripts.
+
+Page texts go into an SQLite FTS5 full-text index and extracted metric rows into a plain table, both keyed by the
+document's content hash. Documents are added as they are analysed (dashboard and batch), and a document that
+is already indexed is not indexed again, so cross-document questions are answered in milliseconds without
+re-extracting any PDF.
+
+Usage:
+    python search_index.py add PDF [PDF ...] [--kind transcript]
+    python search_index.py search "supply chain headwinds" [--kind report]
+    python search_index.py metrics "Operating Cash Flow" --year 2023 --max 0
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+import pandas as pd
+
+import tracing
+
+CACHE_DIR = os.environ.get("FINSIGHT_CACHE_DIR", ".cache")
+SEARCH_INDEX_PATH = os.path.join(CACHE_DIR, "search.sqlite")
+INSERT_BATCH_PAGES = 64   # Pages written per executemany while streaming a document into the index
+SNIPPET_TOKENS = 12       # Words of context around each match
+
+_FTS_SYNTAX = re.compile(r'["*()]|\b(?:AND|OR|NOT|NEAR)\b')
+_WORD = re.compile(r"\w+(?:['.-]\w+)*")
+
+_lock = threading.Lock()
+_connection = None
+_indexing = set()  # Keys of documents being indexed right now
+
+
+def _connect():
+    global _connection
+    if _connection is None:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        _connection = sqlite3.connect(SEARCH_INDEX_PATH, timeout=30, check_same_thread=False)
+        _connection.execute("PRAGMA journal_mode=WAL")
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "key TEXT PRIMARY KEY, name TEXT, company TEXT, kind TEXT NOT NULL, pages INTEGER NOT NULL, "
+            "indexed REAL NOT NULL)"
+        )
+        _connection.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS page_text USING fts5("
+            "text, key UNINDEXED, page UNINDEXED, tokenize='porter unicode61')"
+        )
+        _connection.execute(
+            "CREATE TABLE IF NOT EXISTS metric_rows ("
+            "key TEXT NOT NULL, year INTEGER NOT NULL, metric TEXT NOT NULL, value REAL NOT NULL, "
+            "PRIMARY KEY (key, year, metric))"
+        )
+        _connection.execute("CREATE INDEX IF NOT EXISTS metric_rows_lookup ON metric_rows (metric, year)")
+    return _connection
+
+
+### ---------------- INDEXING ---------------- ###
+def is_indexed(key):
+    """True if the document with this content hash is in the index."""
+    with _lock:
+        return _connect().execute("SELECT 1 FROM documents WHERE key = ?", (key,)).fetchone() is not None
+
+
+@tracing.traced("search.index_document")
+def index_document(document, kind, name=None, company=None):
+    """
+    Adds a document's page texts to the full-text index. Pages are streamed from the document, so indexing
+    runs in flat memory; an already indexed document only has its name and company updated.
+    :param document: A Data_retrieval.PdfDocument.
+    :param kind: "report" or "transcript".
+    :param name: Display name, e.g. the file name (defaults to the file name of the document's path).
+    :param company: Company the document belongs to, if known.
+    :return: True if the pages were indexed, False if the document was already in the index
+    """
+    name = name or os.path.basename(document.path)
+    with _lock:
+        conn = _connect()
+        indexed = conn.execute("SELECT 1 FROM documents WHERE key = ?", (document.key,)).fetchone() is not None
+        if indexed:
+            conn.execute("UPDATE documents SET name = ?, company = COALESCE(?, company), kind = ? WHERE key = ?",
+                         (name, company, kind, document.key))
+            conn.commit()
+        if indexed or document.key in _indexing:
+            tracing.annotate(cache_hit=True)
+            return False
+        _indexing.add(document.key)
+
+    # Pages are read (possibly parsed) without holding the lock; it is only taken to write each batch, so
+    # searches from other sessions are not blocked by a long extraction. The pages only become searchable
+    # once the documents row is written, as all queries join on it.
+    page_count, batch = 0, []
+    try:
+        for page_count, text in enumerate(document, start=1):
+            batch.append((text, document.key, page_count))
+            if len(batch) >= INSERT_BATCH_PAGES:
+                _insert_pages(batch)
+                batch = []
+        _insert_pages(batch)
+        with _lock:
+            conn = _connect()
+            conn.execute("INSERT INTO documents (key, name, company, kind, pages, indexed) VALUES (?, ?, ?, ?, ?, ?)",
+                         (document.key, name, company, kind, page_count, time.time()))
+            conn.commit()
+    except BaseException:
+        with _lock:
+            conn = _connect()
+            conn.rollback()
+            conn.execute("DELETE FROM page_text WHERE key = ?", (document.key,))
+            conn.commit()
+        raise
+    finally:
+        with _lock:
+            _indexing.discard(document.key)
+    tracing.annotate(cache_hit=False, pages=page_count)
+    return True
+
+
+def _insert_pages(rows):
+    with _lock:
+        conn = _connect()
+        conn.executemany("INSERT INTO page_text (text, key, page) VALUES (?, ?, ?)", rows)
+        conn.commit()
+
+
+def index_metrics(key, metrics):
+    """
+    Replaces the metric rows of an indexed document.
+    :param metrics: Long-format DataFrame (Year | Metric | Value), e.g. from extract_key_metrics. Rows without
+                    a numeric year or value (e.g. "574,785" from the LLM fallback) are skipped.
+    """
+    df = pd.DataFrame({"Year": pd.to_numeric(metrics["Year"], errors="coerce"),
+                       "Metric": metrics["Metric"].astype(str),
+                       "Value": pd.to_numeric(metrics["Value"], errors="coerce")}).dropna(subset=["Year", "Value"])
+    rows = [(key, int(year), metric, float(value)) for year, metric, value in df.itertuples(index=False)]
+    with _lock:
+        conn = _connect()
+        conn.execute("DELETE FROM metric_rows WHERE key = ?", (key,))
+        conn.executemany("INSERT OR REPLACE INTO metric_rows (key, year, metric, value) VALUES (?, ?, ?, ?)", rows)
+        conn.commit()
+
+
+def index_analysis(document, kind, name=None, company=None, metrics=None):
+    """Indexes an analysed document and its metric rows; a failed write never fails the analysis."""
+    try:
+        index_document(document, kind, name=name, company=company)
+        if metrics is not None:
+            index_metrics(document.key, metrics)
+    except Exception as e:
+        print(f"Warning: Could not add {name or document.path} to the search index: {e}")
+
+
+def remove(key):
+    """Removes a document, its pages and its metric rows from the index."""
+    with _lock:
+        conn = _connect()
+        conn.execute("DELETE FROM page_text WHERE key = ?", (key,))
+        conn.execute("DELETE FROM metric_rows WHERE key = ?", (key,))
+        conn.execute("DELETE FROM documents WHERE key = ?", (key,))
+        conn.commit()
+
+
+def clear():
+    """Empties the index."""
+    with _lock:
+        conn = _connect()
+        conn.execute("DELETE FROM page_text")
+        conn.execute("DELETE FROM metric_rows")
+        conn.execute("DELETE FROM documents")
+        conn.commit()
+
+
+### ---------------- QUERIES ---------------- ###
+def match_expression(query):
+    """
+    Turns a plain query into an FTS5 expression requiring every word ("supply chain" -> "supply" AND "chain").
+    Queries that already use FTS5 syntax (quotes, AND / OR / NOT / NEAR, prefix*) are passed through.
+    """
+    if _FTS_SYNTAX.search(query):
+        return query
+    return " AND ".join(f'"{word}"' for word in _WORD.findall(query))
+
+
+def _filters(kind, company, alias="d"):
+    clauses, params = [], []
+    if kind:
+        clauses.append(f"{alias}.kind = ?")
+        params.append(kind)
+    if company:
+        clauses.append(f"{alias}.company = ? COLLATE NOCASE")
+        params.append(company)
+    return "".join(f" AND {clause}" for clause in clauses), params
+
+
+def _query(sql, params):
+    with _lock:
+        cursor = _connect().execute(sql, params)
+        return pd.DataFrame(cursor.fetchall(), columns=[column[0] for column in cursor.description])
+
+
+@tracing.traced("search.text")
+def search_text(query, kind=None, company=None, limit=20):
+    """
+    Full-text search over all indexed pages, best matches first (BM25).
+    :param query: Words to look for (all must occur on the page) or an FTS5 expression.
+    :param kind: Only "report" or "transcript" documents.
+    :param company: Only documents of this company.
+    :return: DataFrame with columns company, document, kind, page (1-based), snippet, score
+    :raises ValueError: If the query is not a valid FTS5 expression
+    """
+    expression = match_expression(query)
+    if not expression:
+        return pd.DataFrame(columns=["company", "document", "kind", "page", "snippet", "score"])
+    where, params = _filters(kind, company)
+    sql = (f"SELECT d.company, d.name AS document, d.kind, p.page, "
+           f"snippet(page_text, 0, '**', '**', '…', {SNIPPET_TOKENS}) AS snippet, -bm25(page_text) AS score "
+           f"FROM page_text p JOIN documents d ON d.key = p.key "
+           f"WHERE page_text MATCH ?{where} ORDER BY bm25(page_text) LIMIT ?")
+    try:
+        return _query(sql, [expression, *params, limit])
+    except sqlite3.OperationalError as e:
+        raise ValueError(f"Invalid search query {query!r}: {e}") from e
+
+
+@tracing.traced("search.documents")
+def documents_matching(query, kind=None, company=None):
+    """
+    Documents with at least one page matching the query, e.g. "which peers mentioned supply chain headwinds".
+    :return: DataFrame with columns company, document, kind, hits (matching pages), pages (e.g. "3, 17, 18")
+    :raises ValueError: If the query is not a valid FTS5 expression
+    """
+    expression = match_expression(query)
+    if not expression:
+        return pd.DataFrame(columns=["company", "document", "kind", "hits", "pages"])
+    where, params = _filters(kind, company)
+    sql = (f"SELECT d.company, d.name AS document, d.kind, COUNT(*) AS hits, "
+           f"GROUP_CONCAT(p.page, ', ') AS pages, MIN(p.rank) AS best "
+           f"FROM (SELECT key, page, rank FROM page_text WHERE page_text MATCH ? ORDER BY key, page) p "
+           f"JOIN documents d ON d.key = p.key WHERE 1 = 1{where} GROUP BY d.key ORDER BY best")
+    try:
+        return _query(sql, [expression, *params]).drop(columns="best")
+    except sqlite3.OperationalError as e:
+        raise ValueError(f"Invalid search query {query!r}: {e}") from e
+
+
+@tracing.traced("search.metrics")
+def search_metrics(metric=None, year=None, min_value=None, max_value=None, kind=None, company=None):
+    """
+    Numeric search over the extracted metric rows of all indexed documents,
+    e.g. search_metrics("Operating Cash Flow", year=2023, max_value=0) for negative operating cash flow in 2023.
+    Bounds are inclusive; None means no bound.
+    :return: DataFrame with columns company, document, kind, year, metric, value
+    """
+    clauses, params = [], []
+    for column, operator, value in (("m.metric", "=", metric), ("m.year", "=", year),
+                                    ("m.value", ">=", min_value), ("m.value", "<=", max_value)):
+        if value is not None:
+            clauses.append(f"{column} {operator} ?")
+            params.append(value)
+    where, filter_params = _filters(kind, company)
+    sql = ("SELECT d.company, d.name AS document, d.kind, m.year, m.metric, m.value "
+           "FROM metric_rows m JOIN documents d ON d.key = m.key WHERE 1 = 1"
+           + "".join(f" AND {clause}" for clause in clauses) + where
+           + " ORDER BY m.metric, m.year DESC, m.value")
+    return _query(sql, params + filter_params)
+
+
+def indexed_metrics():
+    """Names of all metrics with indexed rows."""
+    with _lock:
+        return [row[0] for row in _connect().execute("SELECT DISTINCT metric FROM metric_rows ORDER BY metric")]
+
+
+def documents():
+    """All indexed documents: key, name, company, kind, pages, indexed (timestamp), most recent first."""
+    return _query("SELECT key, name, company, kind, pages, indexed FROM documents ORDER BY indexed DESC", [])
+
+
+### ---------------- COMMAND LINE ---------------- ###
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    add = commands.add_parser("add", help="index the page text of PDFs")
+    add.add_argument("pdfs", nargs="+")
+    add.add_argument("--kind", default="report", choices=["report", "transcript"])
+    add.add_argument("--company")
+    search = commands.add_parser("search", help="full-text search")
+    search.add_argument("query")
+    search.add_argument("--kind", choices=["report", "transcript"])
+    search.add_argument("--limit", type=int, default=20)
+    metrics = commands.add_parser("metrics", help="numeric search over extracted metrics")
+    metrics.add_argument("metric", nargs="?")
+    metrics.add_argument("--year", type=int)
+    metrics.add_argument("--min", type=float)
+    metrics.add_argument("--max", type=float)
+    args = parser.parse_args()
+
+    pd.set_option("display.width", 200)
+    pd.set_option("display.max_colwidth", 100)
+    started = time.perf_counter()
+    if args.command == "add":
+        from Data_retrieval import PdfDocument  # Only indexing reads PDFs
+
+        for path in args.pdfs:
+            added = index_document(PdfDocument(path), args.kind, company=args.company)
+            print(f"{'Indexed' if added else 'Already indexed'}: {path}")
+        return
+    try:
+        if args.command == "search":
+            print(documents_matching(args.query, kind=args.kind).to_string(index=False))
+            print()
+            result = search_text(args.query, kind=args.kind, limit=args.limit)
+        else:
+            result = search_metrics(args.metric, args.year, args.min, args.max)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(result.to_string(index=False))
+    print(f"\n{len(result)} result(s) in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# Locates the financial statement pages of a report so that only those are sent to the LLM
+CACHE_DIR = os.environ.get("FINSIGHT_CACHE_DIR", ".cache")
+SECTION_CACHE_DIR = os.path.join(CACHE_DIR, "sections")
+INDEX_VERSION = 1              # Bump when scoring changes to invalidate cached indexes
+MAX_MEMORY_INDEXES = 128       # Indexes kept in memory; least recently used are dropped first
+MAX_DISK_INDEXES = 1024        # Index files kept under SECTION_CACHE_DIR; least recently used are deleted first
+MIN_SECTION_SCORE = 6.0        # Pages scoring below this are never picked
+MAX_PAGES_PER_SECTION = 2      # Statements rarely span more than two pages
+MIN_CONTINUATION_DENSITY = 0.3 # A page following a statement must be mostly table rows to count as its continuation
+
+SECTIONS = {
+    "income_statement": {
+        # Headings are often split over lines, e.g. "Consolidated Statements of 12 Months Ended / Earnings"
+        "heading": r"statements? of(?:\W+\S+){0,4}?\W+(?:operations|income|earnings)\b|income statement|profit and loss",
+        "line_items": ["net sales", "total revenue", "total net revenues", "revenues", "cost of sales",
+                       "operating income", "operating expenses", "income before income taxes",
+                       "provision for income taxes", "net income", "net earnings", "earnings per share",
+                       "interest expense"],
+    },
+    "balance_sheet": {
+        "heading": r"balance sheets?|statements? of(?:\W+\S+){0,4}?\W+financial (?:condition|position)",
+        "line_items": ["total assets", "total current assets", "total liabilities", "total current liabilities",
+                       "accounts payable", "retained earnings", "stockholders' equity", "shareholders' equity",
+                       "cash and cash equivalents", "long-term debt"],
+    },
+    "cash_flow": {
+        "heading": r"statements? of(?:\W+\S+){0,4}?\W+cash flows?|cash flows? statement",
+        "line_items": ["operating activities", "investing activities", "financing activities",
+                       "depreciation and amortization", "purchases of property and equipment",
+                       "capital expenditures", "stock-based compensation", "repayments of"],
+    },
+}
+
+# A table row ends in an amount such as "1,234", "(56.7)" or "$ 8,516"; plain page numbers do not count
+_ROW_END = re.compile(r"(?:\d{1,3}(?:,\d{3})+|\d+\.\d+)\)?$")
+_GENERIC_HEADING = re.compile(r"statements? of")
+_HEADINGS = {section: re.compile(vocab["heading"]) for section, vocab in SECTIONS.items()}
+_memory_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def page_lines(text):
+    """(line, page index) pairs of a text (all on page 0) or of an iterable of page texts."""
+    if isinstance(text, str):
+        return ((line, 0) for line in text.splitlines())
+    return ((line, i) for i, page in enumerate(text) for line in page.splitlines())
+
+
+def _table_density(lines):
+    """Share of lines that look like table rows, i.e. end in an amount."""
+    if not lines:
+        return 0.0
+    return sum(1 for line in lines if _ROW_END.search(line)) / len(lines)
+
+
+def _page_features(page_text):
+    """Returns (top lines, whole page, table density) of a page, lower-cased."""
+    lines = [line.strip().lower().replace("\u2019", "'") for line in page_text.splitlines() if line.strip()]
+    return " ".join(lines[:6]), " ".join(lines), _table_density(lines)
+
+
+def score_page(page_text):
+    """Scores one page for each statement type: headings near the top, known line items, and table density."""
+    top, body, density = _page_features(page_text)
+
+    scores = {}
+    for section, vocab in SECTIONS.items():
+        score = 0.0
+        if _HEADINGS[section].search(top):
+            score += 5
+        elif _HEADINGS[section].search(body):
+            score += 2
+        score += sum(1 for item in vocab["line_items"] if item in body)
+        scores[section] = score * (0.5 + density)  # Prose and tables of contents mention the same words
+    return scores
+
+
+def _is_continuation(page_text):
+    """True if a page looks like the second page of a statement: mostly table rows and no heading of its own."""
+    top, _, density = _page_features(page_text)
+    has_heading = _GENERIC_HEADING.search(top) or any(heading.search(top) for heading in _HEADINGS.values())
+    return density >= MIN_CONTINUATION_DENSITY and not has_heading
+
+
+def locate_statements(pages):
+    """
+    Locates the statements in a single pass over the pages, keeping only the candidate statement pages
+    in memory, so `pages` can be a lazy iterator over a very large document.
+    :param pages: Iterable of page texts.
+    :return: (index, texts): the index as returned by build_section_index, and a dict of page index -> text
+             for the pages it lists
+    """
+    # Per section: [best score, selected page indices, their texts, still extending with continuation pages]
+    best = {section: [None, [], [], False] for section in SECTIONS}
+    for i, text in enumerate(pages):
+        scores = score_page(text)
+        continuation = None
+        for section, candidate in best.items():
+            if candidate[0] is None or scores[section] > candidate[0]:
+                best[section] = [scores[section], [i], [text], True]
+                continue
+            if candidate[3]:
+                if continuation is None:
+                    continuation = _is_continuation(text)
+                if continuation and len(candidate[1]) < MAX_PAGES_PER_SECTION and candidate[1][-1] + 1 == i:
+                    candidate[1].append(i)
+                    candidate[2].append(text)
+                else:
+                    candidate[3] = False
+
+    index, texts = {}, {}
+    for section, (score, selected, selected_texts, _) in best.items():
+        if score is None or score < MIN_SECTION_SCORE:
+            index[section] = []
+            continue
+        index[section] = selected
+        texts.update(zip(selected, selected_texts))
+    return index, texts
+
+
+def build_section_index(pages):
+    """
+    Builds the statement index for a document: the best-scoring page for each statement,
+    followed by the pages that continue it.
+    :param pages: Iterable of page texts.
+    :return: Dict of section name -> sorted zero-based page indices (empty if the section was not found)
+    """
+    return locate_statements(pages)[0]
+
+
+def _document_key(pages):
+    digest = hashlib.sha256(f"v{INDEX_VERSION}".encode())
+    for text in pages:
+        digest.update(b"\x00")
+        digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _cached_index(key, build):
+    """The index cached under `key` (memory, then disk), or build() stored under it. Both caches are bounded."""
+    with _lock:
+        if key in _memory_cache:
+            _memory_cache.move_to_end(key)
+            return _memory_cache[key]
+
+    path = os.path.join(SECTION_CACHE_DIR, f"{key}.json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            index = json.load(f)
+        os.utime(path)  # Mark as recently used for eviction
+    except (OSError, ValueError):
+        index = build()
+        try:
+            os.makedirs(SECTION_CACHE_DIR, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(index, f)
+        except OSError as e:
+            print(f"Error writing section index cache: {e}")
+        _evict_files()
+
+    with _lock:
+        _memory_cache[key] = index
+        while len(_memory_cache) > MAX_MEMORY_INDEXES:
+            _memory_cache.popitem(last=False)
+    return index
+
+
+def get_section_index(pages):
+    """
+    Returns the statement index for a document, building it only once per document (memory and disk cache,
+    both bounded with least-recently-used eviction).
+    """
+    return _cached_index(_document_key(pages), lambda: build_section_index(pages))
+
+
+def _document_index_key(document):
+    return f"doc-v{INDEX_VERSION}-{document.key}"
+
+
+def document_index(document):
+    """The statement index of a Data_retrieval.PdfDocument, cached by its content hash (see document_statements)."""
+    return _cached_index(_document_index_key(document), lambda: build_section_index(document))
+
+
+def document_statements(document):
+    """
+    The statement index of a Data_retrieval.PdfDocument and the texts of its statement pages, like
+    locate_statements, but cached by the document's content hash: the index is built in one pass over the
+    pages the first time and afterwards only the statement pages are read.
+    :return: (index, texts) as returned by locate_statements
+    """
+    built = {}
+
+    def build():
+        index, built["texts"] = locate_statements(document)
+        return index
+
+    index = _cached_index(_document_index_key(document), build)
+    if "texts" in built:
+        return index, built["texts"]
+    return index, document.select(sorted({i for pages in index.values() for i in pages}))
+
+
+def _evict_files(max_files=MAX_DISK_INDEXES):
+    """Deletes the least recently used index files beyond max_files."""
+    try:
+        with os.scandir(SECTION_CACHE_DIR) as it:
+            files = sorted((e.stat().st_mtime, e.path) for e in it if e.name.endswith(".json"))
+    except OSError:
+        return
+    for _, path in files[:max(0, len(files) - max_files)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def statement_pages(pages, sections=tuple(SECTIONS)):
+    """Returns the sorted indices of all pages holding the requested statements."""
+    index = get_section_index(pages)
+    return sorted({i for section in sections for i in index.get(section, [])})
+
+
+def statement_text(pages, sections=tuple(SECTIONS)):
+    """Returns the text of the statement pages only, or None if no statement page was found."""
+    selected = statement_pages(pages, sections)
+    if not selected:
+        return None
+    return "\n".join(pages[i] for i in selected).strip()
@@ -1,50 +1,119 @@
-import google.generativeai as genai
-from textblob import TextBlob
-import Data_retrieval  
+import json
+import re
+import zlib
+import llm_client
+import sentiment_engine
+import tracing
+
+
+SENTIMENT_CHUNK_CHARS = 8000     # Transcript text per Gemini request
+SENTIMENT_ANCHOR_MODULUS = 16    # On average every 16th sentence may end a chunk early (content-defined boundaries)
+SENTIMENT_WORKERS = 4            # Concurrent Gemini requests
+SENTIMENT_RETRIES = 3            # Attempts per chunk when the reply is not valid JSON
+
+SENTIMENT_LABELS = ("positive", "neutral", "negative")
+
+
+def _chunk_bounds(sentences, budget):
+    """Yields (start, stop) sentence ranges of the chunks; see split_sentiment_chunks."""
+    start, size = 0, 0
+    for i, sentence in enumerate(sentences):
+        if i > start and size + len(sentence) > budget:
+            yield start, i
+            start, size = i, 0
+        size += len(sentence) + 1
+        if size >= budget // 2 and zlib.crc32(sentence.encode("utf-8")) % SENTIMENT_ANCHOR_MODULUS == 0:
+            yield start, i + 1
+            start, size = i + 1, 0
+    if start < len(sentences):
+        yield start, len(sentences)
+
+
+def split_sentiment_chunks(text, budget=SENTIMENT_CHUNK_CHARS):
+    """
+    Packs the transcript's sentences into chunks of at most `budget` characters.
+    Like summarizer.split_into_chunks, a chunk that is half full is closed at the next "anchor" sentence chosen
+    by a hash of its content, so an edit only changes the chunks around it and the others stay cached.
+    """
+    sentences = sentiment_engine.split_segments(text)["sentence"].tolist()
+    return [sentences[start:stop] for start, stop in _chunk_bounds(sentences, budget)]
 
-# Configure Gemini API
-from config import GEMINI_API_KEY
 
-genai.configure(api_key=GEMINI_API_KEY)
+def sentiment_chunk_pages(pages, budget=SENTIMENT_CHUNK_CHARS):
+    """Sorted page indices each chunk of split_sentiment_chunks(pages) was read from."""
+    segments = sentiment_engine.split_segments(pages)
+    return [list(range(segments["first_page"].iloc[start], segments["last_page"].iloc[stop - 1] + 1))
+            for start, stop in _chunk_bounds(segments["sentence"].tolist(), budget)]
 
 
-def get_gemini_sentiment(text):
+def parse_sentiment_counts(response_text):
+    """
+    Parses a {"positive": X, "neutral": Y, "negative": Z} reply.
+    :return: Dict of non-negative integer counts, or None if the reply is malformed
+    """
+    match = re.search(r"\{.*\}", response_text or "", re.DOTALL)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+        counts = {label: int(data[label]) for label in SENTIMENT_LABELS}
+    except (ValueError, TypeError, KeyError):
+        return None
+    return counts if all(count >= 0 for count in counts.values()) else None
+
+
+def _gemini_chunk_sentiment(sentences):
+    """Classifies the sentences of one chunk with Gemini, retrying malformed replies."""
+    numbered = "\n".join(f"{i + 1}. {sentence}" for i, sentence in enumerate(sentences))
+    prompt = f"""
+    Classify the sentiment of each of the following {len(sentences)} numbered sentences from an earnings call
+    as positive, neutral or negative, and count how many sentences fall into each class.
+    The three counts must add up to {len(sentences)}.
+    Return only JSON in this exact format (no extra text):
+    {{"positive": X, "neutral": Y, "negative": Z}}
+
+    Sentences:
+    {numbered}
+    """
+    for attempt in range(SENTIMENT_RETRIES):
+        try:
+            counts = parse_sentiment_counts(llm_client.generate_text(prompt, refresh=attempt > 0, keep=True))
+        except Exception as e:
+            print(f"Gemini sentiment request failed (attempt {attempt + 1}): {e}")
+            continue
+        if counts is not None:
+            return counts
+        print(f"Malformed Gemini sentiment reply (attempt {attempt + 1}), retrying chunk.")
+
+    # Keep the chunk in the totals by scoring it locally
+    print("Falling back to lexicon sentiment for one chunk.")
+    return get_textblob_sentiment(" ".join(sentences))
+
+
+def get_gemini_sentiment(text, max_workers=SENTIMENT_WORKERS):
     """
     Uses Gemini API to analyze sentiment.
+    The transcript is split into chunks of whole sentences that are classified concurrently
+    (throttled by llm_client); the per-chunk counts are summed.
     """
-    prompt = f"Analyze the sentiment of the following text and return the counts for positive, neutral, and negative sentiments.\n\nText: {text}\n\nFormat your response as:\nPositive: X\nNeutral: Y\nNegative: Z"
-    
-    model = genai.GenerativeModel("gemini-pro")
-    response = model.generate_content(prompt)
-
-    # Parse the response
-    gemini_sentiment = {"positive": 0, "neutral": 0, "negative": 0}
-    
-    if response and response.text:
-        lines = response.text.split("\n")
-        for line in lines:
-            if "Positive:" in line:
-                gemini_sentiment["positive"] = int(line.split(":")[1].strip())
-            elif "Neutral:" in line:
-                gemini_sentiment["neutral"] = int(line.split(":")[1].strip())
-            elif "Negative:" in line:
-                gemini_sentiment["negative"] = int(line.split(":")[1].strip())
+    chunks = split_sentiment_chunks(text)
+    gemini_sentiment = {label: 0 for label in SENTIMENT_LABELS}
+    if not chunks:
+        return gemini_sentiment
+
+    with tracing.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for counts in pool.map(_gemini_chunk_sentiment, chunks):
+            for label in SENTIMENT_LABELS:
+                gemini_sentiment[label] += counts[label]
 
     return gemini_sentiment
 
 def get_textblob_sentiment(text):
     """
-    Uses TextBlob for sentiment analysis.
+    Uses the TextBlob sentiment lexicon for sentence-level sentiment analysis (see sentiment_engine).
+    Returns the number of positive, neutral and negative sentences.
     """
-    blob = TextBlob(text)
-    polarity = blob.sentiment.polarity  # -1 to 1 scale
-
-    if polarity > 0:
-        return {"positive": 1, "neutral": 0, "negative": 0}
-    elif polarity < 0:
-        return {"positive": 0, "neutral": 0, "negative": 1}
-    else:
-        return {"positive": 0, "neutral": 1, "negative": 0}
+    return sentiment_engine.sentiment_counts(sentiment_engine.analyze_sentiment(text))
 
 def ensemble_sentiment_analysis(text):
     """
@@ -78,6 +147,8 @@ def main():
     """
     Main function to get earnings call transcript from PDF and analyze sentiment.
     """
+    import Data_retrieval  # Only the command-line entry point reads PDFs
+
     pdf_path = input("Enter the path to the earnings call transcript PDF: ")
     transcript_text = Data_retrieval.extract_text_from_pdf(pdf_path)
 
@@ -0,0 +1,190 @@
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+import tracing
+from section_index import page_lines
+
+# Sentence-level lexicon sentiment, scored with NumPy arrays instead of one TextBlob object per text
+POSITIVE_THRESHOLD = 0.05    # Sentence polarity above this counts as positive
+NEGATIVE_THRESHOLD = -0.05   # ... and below this as negative
+PARALLEL_MIN_SENTENCES = 20000
+SENTENCES_PER_SHARD = 5000
+NEGATIONS = ("no", "not", "never", "nor", "cannot", "n't", "don't", "doesn't", "didn't", "isn't", "aren't",
+             "wasn't", "weren't", "won't", "wouldn't", "can't", "couldn't", "shouldn't", "hasn't", "haven't")
+
+_TOKEN = re.compile(r"[a-z]+(?:'[a-z]+)?")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+_SPEAKER = re.compile(r"^((?:[A-Z][\w.'\-]*)(?: [A-Z][\w.'\-]*){0,3}|Operator):\s*(.*)$")
+_SECTION = re.compile(r"^(prepared remarks|presentation|questions? and answers?|question-and-answer session|q&a)\b",
+                      re.IGNORECASE)
+_PAGE_NUMBER = re.compile(r"^\d{1,4}$")
+
+
+@lru_cache(maxsize=1)
+def load_lexicon():
+    """
+    Compiles TextBlob's English sentiment lexicon into lookup arrays (done once per process).
+    :return: (vocabulary dict word -> id, polarity, intensity, is_modifier, is_negation arrays); id 0 = unknown word
+    """
+    import textblob.en
+    path = os.path.join(os.path.dirname(textblob.en.__file__), "en-sentiment.xml")
+
+    senses = {}
+    for node in ElementTree.parse(path).getroot().iter("word"):
+        form = node.get("form", "").lower()
+        if form:
+            senses.setdefault(form, []).append(
+                (float(node.get("polarity", 0.0)), float(node.get("intensity", 1.0)), node.get("pos") == "RB"))
+
+    words = list(senses) + [word for word in NEGATIONS if word not in senses]
+    vocabulary = {word: i + 1 for i, word in enumerate(words)}
+    size = len(words) + 1
+    polarity, intensity = np.zeros(size), np.ones(size)
+    is_modifier, is_negation, is_known = np.zeros(size, bool), np.zeros(size, bool), np.zeros(size, bool)
+    for word, i in vocabulary.items():
+        if word in senses:
+            values = np.array(senses[word], dtype=float)
+            polarity[i], intensity[i] = values[:, 0].mean(), values[:, 1].mean()
+            is_modifier[i], is_known[i] = values[:, 2].any(), True
+        is_negation[i] = word in NEGATIONS
+    return vocabulary, polarity, intensity, is_modifier, is_negation, is_known
+
+
+def score_sentences(sentences):
+    """
+    Scores sentences with the lexicon: the mean polarity of the known words in each sentence,
+    where a preceding adverb scales a word ("very good") and a preceding negation flips it to -0.5x ("not good").
+    :param sentences: List of sentence strings.
+    :return: NumPy array of polarities in [-1, 1], one per sentence (0.0 when no known word occurs)
+    """
+    vocabulary, polarity, intensity, is_modifier, is_negation, is_known = load_lexicon()
+    tokens = [_TOKEN.findall(sentence.lower()) for sentence in sentences]
+    lengths = np.fromiter((len(t) for t in tokens), dtype=np.int64, count=len(tokens))
+    ids = np.fromiter((vocabulary.get(word, 0) for t in tokens for word in t), dtype=np.int64, count=lengths.sum())
+    sentence_of = np.repeat(np.arange(len(sentences)), lengths)
+
+    same_sentence = np.r_[False, sentence_of[1:] == sentence_of[:-1]]
+    prev_ids = np.r_[0, ids[:-1]]
+    known = is_known[ids]
+
+    # Adverb + known word form one assessment: the word's polarity scaled by the adverb's intensity
+    modified = known & same_sentence & is_modifier[prev_ids] & is_known[prev_ids]
+    scores = np.where(modified, np.clip(polarity[ids] * intensity[prev_ids], -1.0, 1.0), polarity[ids])
+    counted = known & ~np.r_[modified[1:], False]
+
+    # Negation within the two preceding words of the same sentence
+    prev2_ids = np.r_[0, 0, ids[:-2]][:len(ids)]
+    same_sentence2 = np.r_[False, False, sentence_of[2:] == sentence_of[:-2]][:len(ids)]
+    negated = (is_negation[prev_ids] & same_sentence) | (is_negation[prev2_ids] & same_sentence2)
+    scores = np.where(negated, -0.5 * scores, scores)
+
+    totals = np.bincount(sentence_of, weights=scores * counted, minlength=len(sentences))
+    counts = np.bincount(sentence_of, weights=counted, minlength=len(sentences))
+    return np.divide(totals, counts, out=np.zeros(len(sentences)), where=counts > 0)
+
+
+def _turn_sentences(lines, pages):
+    """Splits one speaker turn into (sentence, first page, last page) triples."""
+    turn = " ".join(lines)
+    line_starts, offset = [], 0
+    for line in lines:
+        line_starts.append(offset)
+        offset += len(line) + 1
+
+    position = 0
+    for sentence in _SENTENCE_END.split(turn):
+        start = turn.find(sentence, position)
+        position = start + len(sentence)
+        if sentence.strip():
+            first = pages[bisect_right(line_starts, start) - 1]
+            last = pages[bisect_right(line_starts, max(start, position - 1)) - 1]
+            yield sentence.strip(), first, last
+
+
+def split_segments(text):
+    """
+    Splits a transcript into sentences, tagging each with its speaker and section.
+    Speaker turns are recognized by lines such as "Allison Nathan: ..." or "Operator: ...",
+    sections by headings such as "Prepared Remarks" or "Questions and Answers".
+    :param text: Transcript text, or an iterable of page texts (e.g. a PdfDocument) consumed page by page.
+    :return: DataFrame with columns speaker, section, sentence, first_page, last_page (the zero-based pages the
+             sentence was read from; always 0 for plain text)
+    """
+    speaker, section = "Unknown", "Main"
+    turns, current, current_pages = [], [], []
+
+    def close_turn():
+        if current:
+            turns.append((speaker, section, list(current), list(current_pages)))
+            current.clear()
+            current_pages.clear()
+
+    for line, page in page_lines(text):
+        line = line.strip()
+        if not line or _PAGE_NUMBER.match(line):
+            continue
+        if _SECTION.match(line) and len(line) < 60:
+            close_turn()
+            section = line.rstrip(":")
+            continue
+        match = _SPEAKER.match(line)
+        if match:
+            close_turn()
+            speaker, line = match.groups()
+        current.append(line)
+        current_pages.append(page)
+    close_turn()
+
+    rows = [(who, where, sentence, first, last)
+            for who, where, lines, pages in turns for sentence, first, last in _turn_sentences(lines, pages)]
+    return pd.DataFrame(rows, columns=["speaker", "section", "sentence", "first_page", "last_page"])
+
+
+@tracing.traced("transform.sentiment_scoring")
+def analyze_sentiment(text, workers=None):
+    """
+    Scores every sentence of a transcript.
+    Very long inputs are scored in shards on a process pool.
+    :param text: Transcript or report text, or an iterable of page texts.
+    :param workers: Number of worker processes for long inputs (None = one per CPU).
+    :return: DataFrame with columns speaker, section, sentence, polarity, label
+    """
+    segments = split_segments(text)
+    sentences = segments["sentence"].tolist()
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(sentences) >= PARALLEL_MIN_SENTENCES:
+        shards = [sentences[i:i + SENTENCES_PER_SHARD] for i in range(0, len(sentences), SENTENCES_PER_SHARD)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            polarity = np.concatenate(list(pool.map(score_sentences, shards)))
+    else:
+        polarity = score_sentences(sentences)
+
+    segments["polarity"] = polarity
+    segments["label"] = np.select([polarity > POSITIVE_THRESHOLD, polarity < NEGATIVE_THRESHOLD],
+                                  ["positive", "negative"], "neutral")
+    return segments
+
+
+def sentiment_counts(segments):
+    """Returns the number of positive, neutral and negative sentences."""
+    counts = segments["label"].value_counts()
+    return {label: int(counts.get(label, 0)) for label in ("positive", "neutral", "negative")}
+
+
+def aggregate_sentiment(segments, by="speaker"):
+    """
+    Sentiment distribution per speaker or section.
+    :param by: "speaker" or "section".
+    :return: DataFrame with sentence count, mean polarity and positive / neutral / negative shares (in %) per group
+    """
+    shares = pd.crosstab(segments[by], segments["label"], normalize="index").mul(100).round(2)
+    shares = shares.reindex(columns=["positive", "neutral", "negative"], fill_value=0.0)
+    summary = segments.groupby(by)["polarity"].agg(sentences="size", mean_polarity="mean")
+    return summary.join(shares).sort_values("sentences", ascending=False)
@@ -0,0 +1,176 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# Deterministic extraction of the key metrics from financial statement pages (no LLM involved)
+KEY_METRICS = ["Revenue", "EBITDA", "Net Profit", "Total Assets", "Total Liabilities", "Equity",
+               "Operating Cash Flow", "Investing Cash Flow", "Financing Cash Flow"]
+MAX_YEARS = 3  # Same number of years as the Gemini prompt asks for
+
+# Statement -> metric -> line item label patterns, in order of preference.
+# Labels are matched after normalization (lower case, straight quotes, no footnote marks or trailing colon).
+METRIC_SYNONYMS = {
+    "income_statement": {
+        "Revenue": [r"total net sales", r"total net revenues?", r"total revenues?", r"net revenues?",
+                    r"revenues?", r"net sales", r"sales"],
+        "Net Profit": [r"net income(?: \(loss\))?", r"net earnings(?: \(loss\))?", r"net (?:loss|profit)",
+                       r"profit for the (?:year|period)"],
+        "_operating_income": [r"operating income(?: \(loss\))?", r"income from operations", r"operating profit"],
+        "_depreciation": [r"depreciation and amortization.*"],
+    },
+    "balance_sheet": {
+        "Total Assets": [r"total assets"],
+        "Total Liabilities": [r"total liabilities"],
+        "Equity": [r"total (?:stockholders|shareholders)' equity", r"total equity",
+                   r"(?:stockholders|shareholders)' equity"],
+        "_liabilities_and_equity": [r"total liabilities and (?:stockholders'|shareholders')? ?equity"],
+    },
+    "cash_flow": {
+        "Operating Cash Flow": [r"net cash .*operating activities", r"cash flows? from operating activities"],
+        "Investing Cash Flow": [r"net cash .*investing activities", r"cash flows? from investing activities"],
+        "Financing Cash Flow": [r"net cash .*financing activities", r"cash flows? from financing activities"],
+        "_depreciation": [r"depreciation and amortization.*", r"depreciation.*"],
+    },
+}
+_PATTERNS = {
+    section: {metric: [re.compile(f"^{pattern}$") for pattern in patterns] for metric, patterns in metrics.items()}
+    for section, metrics in METRIC_SYNONYMS.items()
+}
+
+_YEAR = re.compile(r"\b(19[89]\d|20\d\d)\b")
+_SCALE = re.compile(r"\b(thousands|millions|billions)\b", re.IGNORECASE)
+_SCALES = {"thousands": 1e3, "millions": 1e6, "billions": 1e9}
+_NUMBER = re.compile(r"^(?:\((\d[\d,]*(?:\.\d+)?)\)|(-?\d[\d,]*(?:\.\d+)?))$")
+_DASHES = {"-", "–", "—"}
+
+
+def parse_amount(token):
+    """
+    Parses one statement cell: "1,234" -> 1234.0, "(56.7)" -> -56.7, "—" -> 0.0.
+    :return: The value, or None if the token is not an amount
+    """
+    token = token.strip().lstrip("$").strip()
+    if token in _DASHES:
+        return 0.0
+    match = _NUMBER.match(token)
+    if not match:
+        return None
+    negative, positive = match.groups()
+    value = float((negative or positive).replace(",", ""))
+    return -value if negative else value
+
+
+def split_row(line):
+    """Splits a statement line into (label, amounts) by peeling amounts off its end."""
+    tokens = line.split()
+    amounts = []
+    while tokens:
+        if tokens[-1] == "$":
+            tokens.pop()
+            continue
+        value = parse_amount(tokens[-1])
+        if value is None:
+            break
+        amounts.append(value)
+        tokens.pop()
+    return " ".join(tokens), amounts[::-1]
+
+
+def normalize_label(label):
+    """Lower-cases a line item label and strips quotes variants, footnote marks and trailing punctuation."""
+    label = label.lower().replace("’", "'").replace("$", "")
+    label = re.sub(r"\s*\(\d+\)|\s*\(note \d+\)", "", label)
+    return re.sub(r"\s+", " ", label).strip(" :")
+
+
+def _page_header(lines):
+    """Returns (fiscal years of the value columns, unit multiplier) from the top lines of a statement page."""
+    top = lines[:10]
+    year_lines = [_YEAR.findall(line) for line in top]
+    years = max(year_lines, key=len, default=[])
+    scale_match = next((m for m in map(_SCALE.search, top) if m), None)
+    scale = _SCALES[scale_match.group(1).lower()] if scale_match else None
+    return [int(year) for year in years], scale
+
+
+def _statement_rows(lines):
+    """Yields (normalized label, amounts) for every line with values, joining labels wrapped over two lines."""
+    pending = None
+    for line in lines:
+        label, amounts = split_row(line)
+        if not amounts:
+            pending = label
+            continue
+        if pending and label[:1].islower():
+            label = f"{pending} {label}"
+        pending = None
+        yield normalize_label(label), amounts
+
+
+def parse_statement(lines, section, years=None, scale=None):
+    """
+    Finds the key metrics of one statement page.
+    :param lines: Text lines of the page (table rows may be passed as lines with cells joined by spaces).
+    :param section: "income_statement", "balance_sheet" or "cash_flow".
+    :param years: Fiscal years of the value columns if already known (continuation pages).
+    :param scale: Unit multiplier if already known.
+    :return: (dict of metric -> {year: value}, years, scale)
+    """
+    page_years, page_scale = _page_header(lines)
+    years = page_years or years or []
+    scale = page_scale or scale or 1.0
+
+    found = {}  # metric -> (preference rank, {year: value})
+    for label, amounts in _statement_rows(lines):
+        if len(amounts) < len(years) or not years:
+            continue
+        values = dict(zip(years, (amount * scale for amount in amounts[-len(years):])))
+        for metric, patterns in _PATTERNS[section].items():
+            rank = next((i for i, pattern in enumerate(patterns) if pattern.match(label)), None)
+            if rank is not None and (metric not in found or rank < found[metric][0]):
+                found[metric] = (rank, values)
+    return {metric: values for metric, (_, values) in found.items()}, years, scale
+
+
+def extract_metrics(pages, section_index, tables=None):
+    """
+    Extracts the key metrics from the statement pages of a report.
+    :param pages: List of page texts.
+    :param section_index: Dict of section -> page indices (see section_index.get_section_index).
+    :param tables: Optional dict of page index -> pdfplumber tables for those pages.
+    :return: Long-format DataFrame (Year | Metric | Value) for the latest MAX_YEARS years; metrics that
+             were not found have no rows
+    """
+    # Pages without a units note ("in millions") use the units stated on the other statement pages
+    all_pages = [i for page_indices in section_index.values() for i in page_indices]
+    default_scale = next((scale for i in all_pages for scale in [_page_header(pages[i].splitlines())[1]] if scale), None)
+
+    metrics = {}
+    for section, page_indices in section_index.items():
+        years, scale = None, default_scale
+        section_metrics = {}
+        for i in page_indices:
+            lines = pages[i].splitlines()
+            for table in (tables or {}).get(i, []):
+                lines += [" ".join(cell or "" for cell in row) for row in table]
+            page_metrics, years, scale = parse_statement(lines, section, years, scale)
+            for metric, values in page_metrics.items():
+                section_metrics.setdefault(metric, values)
+        for metric, values in section_metrics.items():
+            metrics.setdefault(metric, values)  # Statements listed first in the index win
+
+    # Derived metrics for statements that do not report them directly
+    if "EBITDA" not in metrics and "_operating_income" in metrics and "_depreciation" in metrics:
+        metrics["EBITDA"] = {year: value + metrics["_depreciation"].get(year, np.nan)
+                             for year, value in metrics["_operating_income"].items()}
+    if "Total Liabilities" not in metrics and "_liabilities_and_equity" in metrics and "Equity" in metrics:
+        metrics["Total Liabilities"] = {year: value - metrics["Equity"].get(year, np.nan)
+                                        for year, value in metrics["_liabilities_and_equity"].items()}
+
+    found = {metric: values for metric, values in metrics.items() if metric in KEY_METRICS}
+    if not found:
+        return pd.DataFrame(columns=["Year", "Metric", "Value"])
+    wide = pd.DataFrame(found).reindex(columns=[m for m in KEY_METRICS if m in found])
+    wide = wide.sort_index(ascending=False).head(MAX_YEARS).rename_axis("Year")
+    return wide.reset_index().melt(id_vars=["Year"], var_name="Metric", value_name="Value")
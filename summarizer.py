@@ -1,132 +1,283 @@
 
-import json
-import google.generativeai as genai
+import zlib
+from itertools import repeat
+import llm_client
+import ratios
+from section_index import page_lines
+import tracing
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-from config import GEMINI_API_KEY
-from Data_retrieval import get_ticker_from_search,fetch_financial_metrics,extract_text_from_pdf,extract_company_name_llm,extract_key_metrics_llm  # Import your data retrieval module
-
-genai.configure(api_key=GEMINI_API_KEY)  # Configure Gemini API
-model = genai.GenerativeModel('gemini-pro')
+from pipeline import Pipeline
+from Data_retrieval import fetch_peer_metrics,extract_text_from_pdf,extract_pages_from_pdf,extract_company_name_llm,extract_key_metrics  # Import your data retrieval module
 
 
 ### ---------------- SUMMARIZATION FUNCTIONS ---------------- ###
-def summarize_text(text, context="financial report"):
+CHUNK_CHAR_BUDGET = 12000   # ~3000 tokens of report text per Gemini call
+CHUNK_ANCHOR_MODULUS = 32   # On average every 32nd line may end a chunk early (content-defined boundaries)
+SUMMARY_WORKERS = 4         # Chunk summaries requested concurrently
+
+
+def _chunks_with_pages(text, budget):
+    """Yields (chunk, set of page indices its lines came from); see split_into_chunks."""
+    current, pages, size = [], set(), 0
+    for line, page in page_lines(text):
+        while len(line) > budget:  # Very long lines are cut hard
+            line_head, line = line[:budget], line[budget:]
+            if current:
+                yield "\n".join(current), pages
+                current, pages, size = [], set(), 0
+            yield line_head, {page}
+        if size + len(line) + 1 > budget and current:
+            yield "\n".join(current), pages
+            current, pages, size = [], set(), 0
+        current.append(line)
+        pages.add(page)
+        size += len(line) + 1
+        if size >= budget // 2 and zlib.crc32(line.encode("utf-8")) % CHUNK_ANCHOR_MODULUS == 0:
+            yield "\n".join(current), pages
+            current, pages, size = [], set(), 0
+    if current:
+        yield "\n".join(current), pages
+
+
+def split_into_chunks(text, budget=CHUNK_CHAR_BUDGET):
     """
-    Uses Gemini API to summarize a given text.
-    :param text: The text to summarize (from financial reports or earnings call transcripts)
-    :param context: The type of content being summarized.
-    :return: Summarized text
+    Splits text into chunks of at most `budget` characters on line boundaries.
+    Once a chunk is half full it is closed at the next "anchor" line, chosen by a hash of the line's content.
+    Boundaries therefore depend on the text around them rather than on absolute offsets, so an edit
+    only changes the chunks it touches and every other chunk (and its cached summary) stays the same.
+    `text` may also be an iterable of page texts (e.g. a PdfDocument), which is consumed page by page.
+    """
+    return [chunk for chunk, _ in _chunks_with_pages(text, budget) if chunk.strip()]
+
+
+def chunk_pages(pages, budget=CHUNK_CHAR_BUDGET):
+    """Sorted page indices each chunk of split_into_chunks(pages) was cut from."""
+    return [sorted(chunk_pages) for chunk, chunk_pages in _chunks_with_pages(pages, budget) if chunk.strip()]
+
+
+def _summarize_chunk(chunk, context):
+    """Map step: condenses one excerpt. The prompt does not mention the chunk's position so it stays cacheable."""
+    prompt = f"""
+    The following is an excerpt of a {context}.
+    Summarize it in a few bullet points, keeping key figures, trends, risks and important statements.
+
+    Excerpt:
+    {chunk}
     """
+    return llm_client.generate_text(prompt, keep=True).strip()
+
+
+def _combine_summaries(summaries, context):
+    """Reduce step: merges partial summaries of consecutive excerpts into one."""
     prompt = f"""
+    The following are summaries of consecutive parts of a {context}.
+    Merge them into a single summary in bullet points, keeping key figures, trends, risks and important statements.
+
+    Summaries:
+    {chr(10).join(summaries)}
+    """
+    return llm_client.generate_text(prompt).strip()
+
+
+def _group_by_budget(texts, budget):
+    """Groups consecutive texts so that each group's total length stays within budget."""
+    groups, current, size = [], [], 0
+    for text in texts:
+        if current and size + len(text) > budget:
+            groups.append(current)
+            current, size = [], 0
+        current.append(text)
+        size += len(text)
+    groups.append(current)
+    return groups
+
+
+def _final_prompt(parts, context):
+    """Prompt for the final structured summary of the (possibly condensed) document text."""
+    return f"""
     Summarize the following {context} in a concise and structured format.
     Highlight the key insights, trends, and important points.
     
     Text:
-    {text[:3000]}  # Limit input to 3000 characters to avoid token issues
+    {chr(10).join(parts)}
     """
-    
+
+
+def condense_text(text, context="financial report", max_workers=SUMMARY_WORKERS):
+    """
+    Map-reduce phase of summarize_text: splits the text into chunks, summarizes them concurrently and merges
+    the partial summaries until they fit into one final prompt. Returns the parts for the final prompt.
+    Chunk summaries are cached, so running this ahead of time makes the later summary calls cheap.
+    """
+    parts = split_into_chunks(text)
+    with tracing.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        if len(parts) > 1:
+            parts = list(pool.map(_summarize_chunk, parts, repeat(context)))
+        while len(parts) > 1 and sum(len(part) for part in parts) > CHUNK_CHAR_BUDGET:
+            groups = _group_by_budget(parts, CHUNK_CHAR_BUDGET)
+            if len(groups) == len(parts):
+                break  # Every summary already fills a prompt on its own; nothing left to merge
+            parts = list(pool.map(_combine_summaries, groups, repeat(context)))
+    return parts
+
+
+def _stream(prompt, what):
+    """Streams a response, stripping leading whitespace; errors end the stream after printing them."""
+    started = False
     try:
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        for piece in llm_client.stream_text(prompt):
+            if not started:
+                piece = piece.lstrip()
+                started = bool(piece)
+            if piece:
+                yield piece
+    except Exception as e:
+        print(f"Error in {what}:", e)
+
+
+@tracing.traced("llm.summarize_text")
+def summarize_text(text, context="financial report", max_workers=SUMMARY_WORKERS):
+    """
+    Uses Gemini API to summarize a given text.
+    Long documents are summarized map-reduce style: the text is split into chunks that are summarized
+    concurrently, and the partial summaries are merged hierarchically until they fit into one final prompt.
+    Chunk summaries are cached by content, so re-summarizing a partially changed document only pays for
+    the chunks that changed.
+    :param text: The text to summarize (from financial reports or earnings call transcripts), or an iterable
+                 of its page texts such as a PdfDocument
+    :param context: The type of content being summarized.
+    :param max_workers: Maximum number of concurrent Gemini calls.
+    :return: Summarized text
+    """
+    try:
+        parts = condense_text(text, context, max_workers)
+        return llm_client.generate_text(_final_prompt(parts, context)).strip()
     except Exception as e:
         print(f"Error summarizing {context}: {e}")
         return None
-    
-def summarize_financial_metrics(metrics_df):
+
+
+def summarize_text_stream(text, context="financial report", max_workers=SUMMARY_WORKERS):
     """
-    Generates a **short paragraph** summary of the financial metrics.
-    :param metrics_df: Pandas DataFrame containing financial metrics
-    :return: Summary text
+    Streaming version of summarize_text: yields the final summary in pieces as Gemini writes it.
+    The map-reduce phase over long documents runs before the first piece (see condense_text).
     """
-    if metrics_df.empty:
-        return "No financial metrics available."
+    try:
+        parts = condense_text(text, context, max_workers)
+    except Exception as e:
+        print(f"Error summarizing {context}: {e}")
+        return
+    yield from _stream(_final_prompt(parts, context), f"summarizing {context}")
 
-    prompt = f"""
+
+def _financial_metrics_prompt(metrics_df):
+    return f"""
     Given the following key financial metrics, provide a very concise summary (within 3-5 sentences).
     Highlight revenue trends, profitability, cash flow performance  and other significant insights briefly.
     
     Financial Data:
     {metrics_df.to_string(index=False)}
     """
-    
+
+
+def summarize_financial_metrics(metrics_df):
+    """
+    Generates a **short paragraph** summary of the financial metrics.
+    :param metrics_df: Pandas DataFrame containing financial metrics
+    :return: Summary text
+    """
+    if metrics_df is None or metrics_df.empty:
+        return "No financial metrics available."
+
     try:
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        return llm_client.generate_text(_financial_metrics_prompt(metrics_df)).strip()
     except Exception as e:
         print("Error summarizing financial metrics:", e)
         return None
 
 
+def summarize_financial_metrics_stream(metrics_df):
+    """Streaming version of summarize_financial_metrics; yields the summary in pieces."""
+    if metrics_df is None or metrics_df.empty:
+        yield "No financial metrics available."
+        return
+    yield from _stream(_financial_metrics_prompt(metrics_df), "summarizing financial metrics")
+
+
 
 def compare_metrics(main_company_name, competitors):
     """Fetches financial data for the main company and competitors and arranges it for easy comparison."""
-    
-    # Fetch main company ticker and financial data
-    main_ticker = get_ticker_from_search(main_company_name)
-    if not main_ticker:
-        print(f"Error: Could not find ticker for {main_company_name}")
-        return None
+    competitors = [competitor.strip() for competitor in competitors if competitor.strip()]
 
-    main_df = fetch_financial_metrics(main_ticker)
+    # Fetch the main company and all competitors concurrently (results come back in input order)
+    main_df, *competitor_data = fetch_peer_metrics([main_company_name] + competitors)
     if main_df is None:
         print(f"Error: Could not fetch financial metrics for {main_company_name}")
         return None
 
-    # Add company name column to main company dataframe
-    main_df["Company"] = main_company_name
-
-    # Fetch competitor financials
-    competitor_data = []
-    for competitor in competitors:
-        competitor = competitor.strip()
-        ticker = get_ticker_from_search(competitor)
+    with tracing.span("transform.compare_metrics", companies=len(competitor_data) + 1):
+        # Combine all data
+        all_data = [main_df] + [df for df in competitor_data if df is not None]  # List of DataFrames
+        final_df = pd.concat(all_data, axis=0).reset_index(drop=True)
 
-        if ticker:
-            competitor_df = fetch_financial_metrics(ticker)
-            if competitor_df is not None:
-                competitor_df["Company"] = competitor
-                competitor_data.append(competitor_df)
-            else:
-                print(f"Warning: No financial data for {competitor}")
-
-    # Combine all data
-    all_data = [main_df] + competitor_data  # List of DataFrames
-    final_df = pd.concat(all_data, axis=0).reset_index(drop=True)
-
-    # Sort by Year and Metric (to align competitors with main company)
-    final_df.sort_values(by=["Metric", "Year"], ascending=[True, False], inplace=True)
+        # Sort by Year and Metric (to align competitors with main company)
+        final_df.sort_values(by=["Metric", "Year"], ascending=[True, False], inplace=True)
 
     return final_df
 
-def summarize_comparison(main_company_metrics, competitor_metrics):
+def summarize_comparison(main_company_metrics, competitor_metrics, peer_ratios=None, ranks=None):
     """
     Compares the main company's financial metrics with competitors.
+    The prompt carries the precomputed peer-group ratios and percentile ranks (see ratios.py), not the raw tables.
     :param main_company_metrics: Pandas DataFrame of main company metrics.
     :param competitor_metrics: Pandas DataFrame of competitor metrics.
+    :param peer_ratios: Ratios already computed by ratios.peer_group_ratios for this peer group (optional).
+    :param ranks: The percentile ranks returned with peer_ratios.
     :return: Summary text
     """
-    prompt = f"""
-    Compare the financial performance of the main company with its competitor(s) based on the given metrics.
-    Identify strengths, weaknesses, and competitive advantages.
+    try:
+        prompt = _comparison_prompt(main_company_metrics, competitor_metrics, peer_ratios, ranks)
+        return llm_client.generate_text(prompt).strip()
+    except Exception as e:
+        print("Error in competitor comparison:", e)
+        return None
 
-    Main Company Metrics:
-    {main_company_metrics.to_string(index=False)}
 
-    Competitor Metrics:
-    {competitor_metrics.to_string(index=False)}
-    """
-    
+def summarize_comparison_stream(main_company_metrics, competitor_metrics, peer_ratios=None, ranks=None):
+    """Streaming version of summarize_comparison; yields the comparison in pieces."""
     try:
-        response = model.generate_content(prompt)
-        return response.text.strip()
+        prompt = _comparison_prompt(main_company_metrics, competitor_metrics, peer_ratios, ranks)
     except Exception as e:
         print("Error in competitor comparison:", e)
-        return None
+        return
+    yield from _stream(prompt, "competitor comparison")
+
+
+def _comparison_prompt(main_company_metrics, competitor_metrics, peer_ratios=None, ranks=None):
+    main_company = main_company_metrics["Company"].iloc[0]
+    metrics = pd.concat([main_company_metrics, competitor_metrics])
+    if peer_ratios is None or ranks is None:
+        peer_ratios, ranks = ratios.peer_group_ratios(metrics)
+    table = ratios.latest_ratios(peer_ratios) if not peer_ratios.empty else metrics  # No ratio computable: raw rows
+    main_ranks = ranks.loc[main_company].dropna() if main_company in ranks.index else pd.Series(dtype=float)
+    return f"""
+    Compare the financial performance of {main_company} with its competitor(s) based on the precomputed ratios below.
+    Identify strengths, weaknesses, and competitive advantages. Do not recompute the figures.
+    Ratios are for each company's latest fiscal year; YoY is growth over the previous year and CAGR over all
+    years available. Percentile ranks are within the peer group, where 100 is the strongest (lowest leverage).
+
+    Ratios:
+    {table.to_string()}
+
+    {main_company} percentile ranks:
+    {", ".join(f"{name} {rank:.0f}" for name, rank in main_ranks.items())}
+    """
 
 def plot_comparison(df_comparison):
     """Generates bar plots for key financial metrics."""
+    import matplotlib.pyplot as plt  # Plotting libraries are slow to import and only needed here
+    import seaborn as sns
+
     df_comparison.set_index("Company", inplace=True)
     
     plt.figure(figsize=(14, 8))
@@ -143,15 +294,23 @@ def plot_comparison(df_comparison):
 ### ---------------- MAIN EXECUTION ---------------- ###
 def main():
     pdf_path = input("Enter the path to the financial report PDF: ")
-    report_text = extract_text_from_pdf(pdf_path)
+    report_pages = extract_pages_from_pdf(pdf_path)
+    report_text = "\n".join(report_pages).strip()
+
+    # The three LLM stages are independent, so they run concurrently
+    pipeline = Pipeline()
+    pipeline.add("company_name", extract_company_name_llm, report_text)
+    pipeline.add("key_metrics", extract_key_metrics, pdf_path, pages=report_pages, text=report_text)
+    pipeline.add("report_summary", summarize_text, report_text, context="financial report")
+    results = pipeline.run()
 
-    company_name = extract_company_name_llm(report_text)
+    company_name = results["company_name"]
     print("\nExtracted Company Name:", company_name)
 
-    key_metrics_df = extract_key_metrics_llm(report_text)
+    key_metrics_df = results["key_metrics"]
     print("\nExtracted Key Financial Metrics:\n", key_metrics_df)
 
-    report_summary = summarize_text(report_text, context="financial report")
+    report_summary = results["report_summary"]
     print("\nFinancial Report Summary:\n", report_summary)
 
     competitors = input("\nEnter competitor company names (comma-separated): ").split(",")
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Cold, throwaway caches and the offline LLM backend; set before any project module reads them at import time
+os.environ["FINSIGHT_CACHE_DIR"] = tempfile.mkdtemp(prefix="finsight-tests-")
+os.environ["FINSIGHT_LLM_BACKEND"] = "stub"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,11 @@
+import market_cache
+
+
+def test_suffix_only_names_get_distinct_keys():
+    assert market_cache.normalize_company_name("Amazon.com, Inc.") == "amazon"
+    keys = {market_cache.normalize_company_name(name) for name in ("The Company", "Group", "Inc.")}
+    assert len(keys) == 3 and "" not in keys
+
+    market_cache.store_ticker("The Company", None)
+    assert market_cache.lookup_ticker("The Company") == ""
+    assert market_cache.lookup_ticker("Group") is None
@@ -0,0 +1,48 @@
+import os
+
+import Data_retrieval
+import revisions
+import section_index
+from Data_retrieval import PdfDocument, extract_key_metrics
+
+REPORT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset",
+                      "GS financial statements.pdf")
+
+
+def count_passes(monkeypatch):
+    """Counts passes over document pages and statement-locating passes."""
+    counts = {"pages": 0, "locate": 0}
+    pages, locate = PdfDocument.pages, section_index.locate_statements
+
+    def counting_pages(self):
+        counts["pages"] += 1
+        yield from pages(self)
+
+    def counting_locate(document):
+        counts["locate"] += 1
+        return locate(document)
+
+    monkeypatch.setattr(PdfDocument, "pages", counting_pages)
+    monkeypatch.setattr(section_index, "locate_statements", counting_locate)
+    return counts
+
+
+def test_report_statement_index_is_built_once(monkeypatch):
+    monkeypatch.setattr(Data_retrieval, "extract_key_metrics_llm", lambda *args, **kwargs: None)
+    counts = count_passes(monkeypatch)
+
+    # First analysis: scan, dependency graph, metrics
+    document = PdfDocument(REPORT, workers=1)
+    document.scan()
+    revisions.plan_revision(document, kinds=("metrics",))
+    first = extract_key_metrics(document)
+    assert counts["locate"] == 1
+    assert counts["pages"] == 2  # The scan and the single statement-locating pass
+
+    # Same report again: index and statement pages come from the caches, the pages are not read again
+    counts.update(pages=0, locate=0)
+    document = PdfDocument(REPORT, workers=1)
+    revisions.plan_revision(document, kinds=("metrics",))
+    again = extract_key_metrics(document)
+    assert counts == {"pages": 0, "locate": 0}
+    assert (first is None and again is None) or first.equals(again)
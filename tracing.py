@@ -0,0 +1,248 @@
+import bisect
+import concurrent.futures
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Lightweight spans around the hot paths (PDF parsing, LLM calls, Yahoo fetches, DataFrame transforms).
+# Finished spans are kept in a bounded in-memory buffer, aggregated into Prometheus-style histograms,
+# optionally logged as JSON lines, and can be captured per run for the Streamlit timing panel.
+MAX_SPANS = int(os.environ.get("FINSIGHT_TRACE_MAX_SPANS", "5000"))
+TRACE_LOG = os.environ.get("FINSIGHT_TRACE_LOG")  # "-" for stderr, or a file path
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # Seconds
+
+logger = logging.getLogger("finsight.trace")
+if TRACE_LOG:
+    _handler = logging.StreamHandler() if TRACE_LOG == "-" else logging.FileHandler(TRACE_LOG, encoding="utf-8")
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+_lock = threading.Lock()
+_local = threading.local()
+_recent = deque(maxlen=MAX_SPANS)
+_histograms = {}   # Span name -> [bucket counts..., +Inf count, sum of seconds]
+_counters = {}     # (metric, span name) -> value
+# Lists collecting finished spans for the capture() blocks of the current run. A context variable rather than a
+# global, so concurrent runs (dashboard sessions, background jobs) each capture only their own spans; worker
+# threads inherit it through ThreadPoolExecutor below.
+_captures = contextvars.ContextVar("finsight_trace_captures", default=())
+
+
+class Span:
+    """One timed operation. Attributes can be added while it runs with set()."""
+
+    def __init__(self, name, attrs, parent):
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.thread = threading.current_thread().name
+        self.captures = _captures.get()  # Bound at start: a generator's span may end in another context
+        self.start = time.time()
+        self._perf_start = time.perf_counter()
+        self.duration = None
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def elapsed(self):
+        """Seconds since the span started."""
+        return time.perf_counter() - self._perf_start
+
+    def to_dict(self):
+        return {"span": self.name, "parent": self.parent, "start": round(self.start, 6),
+                "duration_s": round(self.duration, 6), "thread": self.thread, "error": self.error, **self.attrs}
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Times the enclosed block as a span called `name`. Names are dotted by category
+    ("pdf.", "llm.", "yahoo.", "transform."), which the timing breakdown groups by.
+    """
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    current = Span(name, attrs, stack[-1].name if stack else None)
+    stack.append(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.duration = current.elapsed()
+        stack.pop()
+        _record(current)
+
+
+def start_span(name, **attrs):
+    """
+    Starts a span that is not bound to a block, e.g. one covering a generator's whole lifetime
+    (which may interleave with other spans in the consuming thread). Finish it with end_span().
+    """
+    return Span(name, attrs, None)
+
+
+def end_span(started, error=None):
+    started.duration = started.elapsed()
+    started.error = error
+    _record(started)
+
+
+def traced(name):
+    """Decorator form of span()."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def annotate(**attrs):
+    """Adds attributes to the innermost span running in this thread (no-op outside a span)."""
+    stack = getattr(_local, "stack", None)
+    if stack:
+        stack[-1].set(**attrs)
+
+
+def _record(finished):
+    with _lock:
+        _recent.append(finished)
+        for captured in finished.captures:
+            captured.append(finished)
+
+        histogram = _histograms.setdefault(finished.name, [0] * (len(BUCKETS) + 2))
+        histogram[bisect.bisect_left(BUCKETS, finished.duration)] += 1
+        histogram[-1] += finished.duration
+        if finished.error:
+            _counters["errors", finished.name] = _counters.get(("errors", finished.name), 0) + 1
+        if finished.attrs.get("cache_hit"):
+            _counters["cache_hits", finished.name] = _counters.get(("cache_hits", finished.name), 0) + 1
+        if "prompt_tokens" in finished.attrs and not (finished.attrs.get("cache_hit") or finished.attrs.get("coalesced")):
+            _counters["prompt_tokens", finished.name] = (_counters.get(("prompt_tokens", finished.name), 0)
+                                                         + finished.attrs["prompt_tokens"])
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(finished.to_dict(), default=str))
+
+
+@contextmanager
+def capture():
+    """
+    Collects the spans started in this run while the block runs, e.g. for one dashboard job: those of the
+    calling thread and of work it hands to tracing.ThreadPoolExecutor, but not those of other sessions or jobs.
+    """
+    captured = []
+    token = _captures.set(_captures.get() + (captured,))
+    try:
+        yield captured
+    finally:
+        _captures.reset(token)
+
+
+class ThreadPoolExecutor(concurrent.futures.ThreadPoolExecutor):
+    """A thread pool whose tasks run in a copy of the submitting thread's context, so capture() sees their spans."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def recent_spans():
+    """Returns the most recent finished spans (up to MAX_SPANS)."""
+    with _lock:
+        return list(_recent)
+
+
+def breakdown(spans):
+    """
+    Summarizes spans into a timing table: one row per span name with call count, total / mean / max seconds
+    and cache hits, sorted by total time. Nested spans are included, so totals overlap across levels.
+    """
+    import pandas as pd  # Keeps pandas out of the import path of modules that only record spans
+
+    columns = ["Category", "Span", "Calls", "Total s", "Mean s", "Max s", "Cache hits"]
+    if not spans:
+        return pd.DataFrame(columns=columns)
+    df = pd.DataFrame({
+        "Span": [s.name for s in spans],
+        "Duration": [s.duration for s in spans],
+        "Cache hit": [bool(s.attrs.get("cache_hit")) for s in spans],
+    })
+    table = df.groupby("Span").agg(Calls=("Duration", "size"), Total=("Duration", "sum"), Mean=("Duration", "mean"),
+                                   Max=("Duration", "max"), Hits=("Cache hit", "sum")).reset_index()
+    table.insert(0, "Category", table["Span"].str.split(".").str[0])
+    table.columns = columns
+    return table.sort_values("Total s", ascending=False).round(4).reset_index(drop=True)
+
+
+def prometheus_text():
+    """Renders span histograms and counters in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {name: list(values) for name, values in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = ["# HELP finsight_span_seconds Duration of traced operations.", "# TYPE finsight_span_seconds histogram"]
+    for name, values in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), values[:-1]):
+            cumulative += count
+            lines.append(f'finsight_span_seconds_bucket{{span="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'finsight_span_seconds_sum{{span="{name}"}} {values[-1]:.6f}')
+        lines.append(f'finsight_span_seconds_count{{span="{name}"}} {cumulative}')
+
+    for metric, help_text in (("errors", "Traced operations that raised."),
+                              ("cache_hits", "Traced operations served from a cache."),
+                              ("prompt_tokens", "Estimated LLM prompt tokens sent to the backend.")):
+        lines += [f"# HELP finsight_{metric}_total {help_text}", f"# TYPE finsight_{metric}_total counter"]
+        for (kind, name), value in sorted(counters.items()):
+            if kind == metric:
+                lines.append(f'finsight_{metric}_total{{span="{name}"}} {value}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        payload = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+_server = None
+
+
+def start_metrics_server(port=9464, host="127.0.0.1"):
+    """Serves prometheus_text() on http://host:port/metrics from a daemon thread (once per process)."""
+    global _server
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, daemon=True).start()
+        return _server
+
+
+def reset():
+    """Drops all recorded spans and metrics."""
+    with _lock:
+        _recent.clear()
+        _histograms.clear()
+        _counters.clear()